@@ -0,0 +1,98 @@
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+
+# idle connections kept per server (host, port), connections open at once per server (in use or idle),
+# and how long an idle connection is kept (httpfs closes it after 5 seconds without a request)
+DEFAULT_MAX_IDLE = 4
+DEFAULT_MAX_PER_HOST = 8
+DEFAULT_IDLE_TIMEOUT = 4
+
+
+class ConnectionPool:
+    """
+    ConnectionPool keeps the persistent (keep-alive) connections of httpc open between requests,
+    so that requests to the same server do not pay a TCP handshake each. It may be shared by threads.
+
+    A connection is acquired for one request and released after its response: it is kept idle
+    if the server keeps it alive. An idle connection the server closed meanwhile (stale) is
+    detected and dropped when it would be acquired.
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE, max_per_host=DEFAULT_MAX_PER_HOST, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.max_idle = max_idle
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        # (host, port) -> [(socket, idle since)], most recently released last
+        self.idle = defaultdict(list)
+        # (host, port) -> number of connections open
+        self.opened = Counter()
+        self.available = threading.Condition()
+
+    def acquire(self, host, port, timeout=None):
+        """acquire returns (socket, reused) connected to host:port, reused if it was idle in the pool.
+
+            It waits for another request to release a connection if max_per_host are open already.
+
+            Raises:
+                TimeoutError: if no connection was released within timeout.
+                OSError: if the connection to the server failed.
+        """
+        key = (host, port)
+        with self.available:
+            while True:
+                while self.idle[key]:
+                    conn, idle_since = self.idle[key].pop()
+                    if time.monotonic() - idle_since < self.idle_timeout and not self.is_stale(conn):
+                        return conn, True
+                    conn.close()
+                    self.opened[key] -= 1
+                if self.opened[key] < self.max_per_host:
+                    self.opened[key] += 1
+                    break
+                if not self.available.wait(timeout):
+                    raise TimeoutError("no connection to {}:{} released within {}s".format(host, port, timeout))
+
+        # connect outside of the lock, the other requests keep acquiring and releasing meanwhile
+        try:
+            return socket.create_connection(key), False
+        except OSError:
+            with self.available:
+                self.opened[key] -= 1
+                self.available.notify()
+            raise
+
+    def release(self, host, port, conn, reusable):
+        """release gives back a connection acquired, kept idle if reusable (the server keeps it alive)."""
+        key = (host, port)
+        with self.available:
+            if reusable and len(self.idle[key]) < self.max_idle:
+                self.idle[key].append((conn, time.monotonic()))
+            else:
+                conn.close()
+                self.opened[key] -= 1
+            self.available.notify()
+
+    def close(self):
+        """close closes the idle connections."""
+        with self.available:
+            for key, connections in self.idle.items():
+                for conn, _ in connections:
+                    conn.close()
+                self.opened[key] -= len(connections)
+            self.idle.clear()
+
+    @staticmethod
+    def is_stale(conn):
+        # an idle connection has nothing to read: EOF (or anything else) means the server closed it
+        conn.setblocking(False)
+        try:
+            conn.recv(1, socket.MSG_PEEK)
+            return True
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            conn.setblocking(True)
@@ -21,6 +21,8 @@ class HttpcManuals:
     \nThe commands are: \
     \n    get\texecutes a HTTP GET request and prints the response. \
     \n    post\texecutes a HTTP POST request and prints the response. \
+    \n    batch\texecutes a list of HTTP requests concurrently and records their responses. \
+    \n    bench\tdrives a server with HTTP requests and reports its throughput and latency. \
     \n    help\tprints this screen. \
     "
     HELP_EPILOG = "Use \"httpc help [command]\" for more information about a command."
@@ -30,18 +32,38 @@ class HttpcManuals:
     D_HELP = '''Associates an inline data to the body HTTP POST request.'''
     F_HELP = '''Associates the content of a file to the body HTTP POST request.'''
     O_HELP = '''Returns the body of the response to the specified file instead of the console.'''
+    NO_CACHE_HELP = '''Downloads the response again instead of revalidating the one kept in ./outputs/cache/ (If-None-Match / If-Modified-Since).'''
+    SEGMENTS_HELP = '''Downloads the file as this many byte ranges in parallel (requires -o), resumed if it was interrupted. Default is 1.'''
 
     GET_HELP = "Get executes a HTTP GET reqeust for a given URL."
     POST_HELP = "Post executes a HTTP POST request for a given URL with inline data or form file."
     POST_EPILOG = "Either [-d] or [-f] can be used but not both."
+    BATCH_HELP = "Batch executes the HTTP requests listed in a file (or the standard input) over pooled connections."
+    BATCH_EPILOG = "One request per line: METHOD URL [key:value ...], or a JSON object with method, url, headers, body_file and data."
+    C_HELP = '''Number of requests executed at once. Default is 8.'''
+    OUTPUT_DIR_HELP = '''Saves the body of each response to a file of this directory instead of discarding it.'''
+    RESULTS_HELP = '''Writes the result of each request (status, bytes, elapsed time, error) as a JSON line to this file instead of the console.'''
+    BENCH_HELP = "Bench drives a URL of the server with persistent connections and reports throughput, latency percentiles and errors."
+    CONNECTIONS_HELP = '''Number of connections sending requests at once. Default is 8.'''
+    DURATION_HELP = '''Runs for this many seconds. Default is 10 unless -n is given.'''
+    REQUESTS_HELP = '''Runs this many requests instead of a duration.'''
+    MODE_HELP = '''closed: a connection sends its next request once the previous response is in (default). \
+    \n      open: requests are due at --rate whatever the server does, latency counts from the time they were due.'''
+    RATE_HELP = '''Requests per second in the open-loop mode.'''
+    POST_RATIO_HELP = '''Share of the requests which are POST (0 to 1). Default is 0.'''
+    POST_URL_HELP = '''URL the POST requests are sent to. Default is URL.'''
+    POST_DATA_HELP = '''Body of the POST requests.'''
+    JSON_HELP = '''Writes the report (with the latency histogram) as JSON to this file, - for the console.'''
 
     GET_HELP_CUSTOM = "\
-    \nUsage: httpc get [-v] [-h key:value] URL [-o output-file] FILENAME \
+    \nUsage: httpc get [-v] [-h key:value] URL [-o output-file] [--segments N] [--no-cache] FILENAME \
     \n \
     \nGet executes a HTTP GET reqeust for a given URL. \
     \n  -v              {} \
     \n  -h key:value    {} \
-    ".format(V_HELP, H_HELP)
+    \n  --segments N    {} \
+    \n  --no-cache      {} \
+    ".format(V_HELP, H_HELP, SEGMENTS_HELP, NO_CACHE_HELP)
 
     POST_HELP_CUSTOM = "\
     \nUsage: httpc post [-v] [-h key:value] [-d inline-data] [-f file] URL [-o output-file] FILENAME\
@@ -55,6 +77,33 @@ class HttpcManuals:
     \nEither [-d] or [-f] can be used but not both. \
     ".format(V_HELP, H_HELP, D_HELP, F_HELP)
 
+    BATCH_HELP_CUSTOM = "\
+    \nUsage: httpc batch [-c concurrency] [-o output-dir] [-r results-file] [REQUESTS-FILE] \
+    \n \
+    \nBatch executes the HTTP requests listed in a file (or the standard input) over pooled connections. \
+    \n  -c N            {} \
+    \n  -o dir          {} \
+    \n  -r file         {} \
+    \n \
+    \n{} \
+    ".format(C_HELP, OUTPUT_DIR_HELP, RESULTS_HELP, BATCH_EPILOG)
+
+    BENCH_HELP_CUSTOM = "\
+    \nUsage: httpc bench [-c connections] [-d seconds | -n requests] [--mode closed|open] [--rate R] \
+    \n                   [--post-ratio P] [--post-url URL] [--post-data string] [--json file] URL \
+    \n \
+    \nBench drives a URL of the server with persistent connections and reports throughput, latency percentiles and errors. \
+    \n  -c N            {} \
+    \n  -d seconds      {} \
+    \n  -n N            {} \
+    \n  --mode          {} \
+    \n  --rate R        {} \
+    \n  --post-ratio P  {} \
+    \n  --post-url URL  {} \
+    \n  --post-data     {} \
+    \n  --json file     {} \
+    ".format(CONNECTIONS_HELP, DURATION_HELP, REQUESTS_HELP, MODE_HELP, RATE_HELP, POST_RATIO_HELP, POST_URL_HELP, POST_DATA_HELP, JSON_HELP)
+
 
 class HttpfsManuals:
 
@@ -62,13 +111,23 @@ class HttpfsManuals:
     P_HELP = '''Specifies the port number that the server will listen and serve at. \
     \n      Default is 8080.'''
     D_HELP = '''Associates an inline data to the body HTTP POST request.'''
+    WORKERS_HELP = '''Number of worker threads serving the connections (file I/O threads with --engine async). Default is 8.'''
+    QUEUE_SIZE_HELP = '''Connections that may wait for a free worker, the next ones get a 503 right away. Default is 32.'''
+    BACKLOG_HELP = '''Connections the system holds until the server accepts them (listen backlog). Default is 128.'''
+    ENGINE_HELP = '''threads: a pool of worker threads (default). async: one event loop for every connection.'''
+    PROCESSES_HELP = '''Worker processes sharing the port (SO_REUSEPORT), each one running the engine. Default is 1.'''
 
     HELP = "httpfc is a simple file server. \
-    \nUsage: httpfc [-v] [-p PORT] [-d PATH-TO-DIR] \
+    \nUsage: httpfc [-v] [-p PORT] [-d PATH-TO-DIR] [--workers N] [--queue-size N] [--backlog N] [--engine threads|async] [--processes N] \
     \n  -v\t{} \
     \n  -p\t{} \
     \n  -d\t{} \
-    ".format(V_HELP, P_HELP, D_HELP)
+    \n  --workers\t{} \
+    \n  --queue-size\t{} \
+    \n  --backlog\t{} \
+    \n  --engine\t{} \
+    \n  --processes\t{} \
+    ".format(V_HELP, P_HELP, D_HELP, WORKERS_HELP, QUEUE_SIZE_HELP, BACKLOG_HELP, ENGINE_HELP, PROCESSES_HELP)
 
 
 
@@ -86,4 +145,8 @@ if __name__ == '__main__':
     print()
     print(HttpcManuals.POST_HELP_CUSTOM)
     print()
+    print(HttpcManuals.BATCH_HELP_CUSTOM)
+    print()
+    print(HttpcManuals.BENCH_HELP_CUSTOM)
+    print()
     print(HttpfsManuals.HELP)
\ No newline at end of file
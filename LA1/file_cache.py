@@ -0,0 +1,122 @@
+import os
+import stat
+import threading
+from collections import OrderedDict, namedtuple
+from wsgiref.handlers import format_date_time
+
+# byte budget of the cache (paths and contents of the files kept in memory),
+# and size of the largest file whose content is kept (larger ones are sent from disk)
+DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+MAX_CACHED_FILE_SIZE = 256 * 1024
+
+# stat metadata of a path served (mtime in ns, size in bytes),
+# and the content of the file if it is small enough to be kept (bytes, otherwise None),
+# or for a directory the names of its entries (sorted) and the listing rendered from them (content),
+# with the validators of the path sent to the clients (ETag from the mtime and size, Last-Modified date)
+CachedFile = namedtuple('CachedFile', ['mtime', 'size', 'is_dir', 'is_file', 'content', 'listing', 'etag', 'last_modified'])
+
+
+class FileCache:
+    """
+    FileCache is an LRU cache of the paths served by httpfs, shared by the worker threads.
+
+    A lookup costs a single os.stat: the entry is only used if the mtime and size of the
+    path are still the ones it was cached with, otherwise it is read again (miss).
+    The mtime of a directory changes whenever an entry is added to or removed from it,
+    so its listing is only read again then.
+    A path written by a POST is invalidated right away, along with the directories it is in.
+
+    The validators of an entry change along with it, so they are computed once per version of the path.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, max_file_size=MAX_CACHED_FILE_SIZE):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, path):
+        """lookup returns the CachedFile of path, or None if it does not exist."""
+        key = os.path.normpath(path)
+        try:
+            path_stat = os.stat(key)
+        except OSError:
+            self.invalidate(key)
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.mtime == path_stat.st_mtime_ns and entry.size == path_stat.st_size:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # read outside of the lock, the other workers keep being served from the cache meanwhile
+        content = None
+        listing = None
+        try:
+            if stat.S_ISDIR(path_stat.st_mode):
+                listing = tuple(sorted(os.listdir(key)))
+                content = '\n'.join(listing).encode("utf-8")
+            elif stat.S_ISREG(path_stat.st_mode) and path_stat.st_size <= self.max_file_size:
+                with open(key, 'rb') as file:
+                    content = file.read()
+        except OSError:
+            content = listing = None
+        entry = CachedFile(path_stat.st_mtime_ns, path_stat.st_size,
+                           stat.S_ISDIR(path_stat.st_mode), stat.S_ISREG(path_stat.st_mode), content, listing,
+                           entity_tag(path_stat.st_mtime_ns, path_stat.st_size), format_date_time(path_stat.st_mtime))
+        self.store(key, entry)
+        return entry
+
+    def invalidate(self, path):
+        """invalidate drops the entry of path (written or deleted since it was cached)."""
+        with self.lock:
+            self.remove(os.path.normpath(path))
+
+    def invalidate_written(self, path, root):
+        """invalidate_written drops path and the listings of the directories it is in, up to root."""
+        path, root = os.path.normpath(path), os.path.normpath(root)
+        with self.lock:
+            self.remove(path)
+            while path != root and os.path.dirname(path) != path:
+                path = os.path.dirname(path)
+                self.remove(path)
+
+    def stats(self):
+        """stats returns (hits, misses, number of entries, bytes used)."""
+        with self.lock:
+            return self.hits, self.misses, len(self.entries), self.size
+
+    def store(self, key, entry):
+        entry_size = self.entry_size(key, entry)
+        with self.lock:
+            self.remove(key)
+            if entry_size > self.max_size:
+                return
+            self.entries[key] = entry
+            self.size += entry_size
+            # evict the least recently used entries until the cache fits its budget again
+            while self.size > self.max_size:
+                old_key, old_entry = self.entries.popitem(last=False)
+                self.size -= self.entry_size(old_key, old_entry)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= self.entry_size(key, entry)
+
+    @staticmethod
+    def entry_size(key, entry):
+        # the names of a listing take about as much memory as the listing rendered from them
+        content_size = len(entry.content) if entry.content is not None else 0
+        return len(key) + (2 * content_size if entry.listing is not None else content_size)
+
+
+def entity_tag(mtime, size):
+    """entity_tag returns the ETag of a path from its mtime (in ns) and size, which change whenever it is written."""
+    return '"{:x}-{:x}"'.format(mtime, size)
@@ -0,0 +1,305 @@
+'''
+HTTP messages follow each other on a persistent connection (several may come in one recv,
+one may take several recv), so the end of a message is found from its header:
+the body is Content-Length bytes long.
+Without Content-Length, a response lasts until the peer closes the connection (FIN),
+and so does a request with a Transfer-Encoding (its body is not decoded):
+any other request has no body (RFC 7230, section 3.3.3).
+'''
+from email.utils import parsedate_to_datetime
+
+
+def message_bounds(data, closed=False):
+    """message_bounds finds the first complete HTTP message in the bytes received so far.
+
+        Empty lines in front of it (such as the CRLF sent after a POST body) are skipped.
+
+        Args:
+            data: the bytes received (bytes or bytearray).
+            closed: the peer sent its FIN, nothing will be added to data anymore:
+                whatever is left makes the last message.
+
+        Returns:
+            (start, end) of the message in data, or None if it is not complete yet
+            (or there is none left once closed).
+    """
+    start = 0
+    while data.startswith(b'\r\n', start):
+        start += 2
+    if start == len(data):
+        return None
+
+    header_end = data.find(b'\r\n\r\n', start)
+    if header_end == -1:
+        return (start, len(data)) if closed else None
+
+    content_length = None
+    transfer_encoding = False
+    header_lines = bytes(data[start:header_end]).split(b'\r\n')
+    for header in header_lines[1:]:
+        name, _, value = header.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            try:
+                content_length = max(int(value.strip()), 0)
+            except ValueError:
+                pass
+        elif name == b'transfer-encoding':
+            transfer_encoding = True
+
+    if content_length is None:
+        if header_lines[0].startswith(b'HTTP/') or transfer_encoding:
+            # the body is delimited by the end of the connection
+            return (start, len(data)) if closed else None
+        # a request which does not announce a body has none, whatever its method
+        content_length = 0
+
+    end = header_end + 4 + content_length
+    if len(data) >= end:
+        return (start, end)
+    # a body cut short by the FIN is all there will ever be
+    return (start, len(data)) if closed else None
+
+
+def next_message(data, closed=False):
+    """next_message takes the first complete HTTP message out of the bytes received so far.
+
+        Each message is returned exactly once, as it is removed from data along with
+        the empty lines in front of it.
+
+        Args:
+            data: the in-order bytes received on the connection (bytearray), consumed in place.
+            closed: the peer sent its FIN (see message_bounds).
+
+        Returns:
+            the whole message (bytes), or None if no message is complete yet.
+    """
+    bounds = message_bounds(data, closed)
+    if bounds is None:
+        return None
+    start, end = bounds
+    message = bytes(data[start:end])
+    del data[:end]
+    return message
+
+
+def parse_range(headers, size):
+    """parse_range finds the bytes requested by the Range header of a request, for a file of size bytes.
+
+        A single range is served (bytes=first-last, bytes=first- or bytes=-suffix-length):
+        several ranges, other units or a header which is not valid are ignored, the whole file is sent.
+
+        Args:
+            headers: the header lines of the request ('Name: value' str).
+            size: size of the file in bytes.
+
+        Returns:
+            (first, last) positions of the bytes (inclusive), or None for the whole file.
+
+        Raises:
+            ValueError: if the range is not satisfiable (none of its bytes are in the file).
+    """
+    value = None
+    for header in headers:
+        name, _, header_value = header.partition(':')
+        if name.strip().lower() == 'range':
+            value = header_value
+    if value is None:
+        return None
+
+    unit, _, byte_range = value.strip().partition('=')
+    first, dash, last = byte_range.strip().partition('-')
+    first, last = first.strip(), last.strip()
+    if unit.strip().lower() != 'bytes' or ',' in byte_range or not dash or \
+            not (first.isdigit() or first == '') or not (last.isdigit() or last == '') or first == last == '':
+        return None
+
+    if first == '':
+        # the last bytes of the file
+        if int(last) == 0 or size == 0:
+            raise ValueError("range not satisfiable: {}".format(value.strip()))
+        return max(size - int(last), 0), size - 1
+    first, last = int(first), int(last) if last else None
+    if last is not None and last < first:
+        return None
+    if first >= size:
+        raise ValueError("range not satisfiable: {}".format(value.strip()))
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+def range_applies(headers, etag, last_modified):
+    """range_applies tells if the Range header of a request is to be served (If-Range).
+
+        A client resuming a download sends back the validator of the bytes it has with If-Range:
+        if the path changed since, the whole of it is sent (200) instead of the bytes requested.
+        An ETag must match exactly (strong comparison), a date must be the Last-Modified of the path.
+
+        Args:
+            headers: the header lines of the request ('Name: value' str).
+            etag: ETag of the path.
+            last_modified: Last-Modified of the path (HTTP date).
+
+        Returns:
+            True if the request has no If-Range or if its validator is the one of the path.
+    """
+    if_range = None
+    for header in headers:
+        name, _, value = header.partition(':')
+        if name.strip().lower() == 'if-range':
+            if_range = value.strip()
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return not if_range.startswith('W/') and not etag.startswith('W/') and if_range == etag
+    return bool(last_modified) and if_range == last_modified
+
+
+def not_modified(headers, etag, mtime):
+    """not_modified tells if the client has the current version of a path already (conditional GET).
+
+        If-None-Match is used if the request has it (weak comparison: W/ prefixes are ignored),
+        otherwise If-Modified-Since (a date which is not valid is ignored).
+
+        Args:
+            headers: the header lines of the request ('Name: value' str).
+            etag: ETag of the path.
+            mtime: modification time of the path (seconds since the epoch).
+
+        Returns:
+            True if the response is 304 Not Modified.
+    """
+    if_none_match = if_modified_since = None
+    for header in headers:
+        name, _, value = header.partition(':')
+        name = name.strip().lower()
+        if name == 'if-none-match':
+            if_none_match = value.strip()
+        elif name == 'if-modified-since':
+            if_modified_since = value.strip()
+
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or strip_weak(etag) in (strip_weak(tag) for tag in tags)
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        # the date sent in Last-Modified has no fraction of a second
+        return int(mtime) <= since
+    return False
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+# bytes read from the socket at once by a ResponseReader
+RECV_SIZE = 65536
+# statuses whose response never has a body
+BODYLESS_STATUSES = (204, 304)
+
+
+class ResponseReader:
+    """
+    ResponseReader reads an HTTP response from a socket as it arrives: the status line and the headers
+    first (read_head), then the body by chunks (body_chunks), so that it is never all in memory.
+
+    The body is delimited by Content-Length, chunked transfer-encoding, or the end of the connection.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.head = b''
+        self.status_line = ''
+        self.status_code = None
+        # lower-case name -> value
+        self.headers = {}
+        # the whole body was read: nothing of this response is left on the connection
+        self.complete = False
+
+    def read_head(self):
+        """read_head reads the status line and the headers.
+
+            Raises:
+                ConnectionAbortedError: if the connection closed before the end of the headers.
+        """
+        header_end = self.buffer.find(b'\r\n\r\n')
+        while header_end == -1:
+            if not self.fill():
+                raise ConnectionAbortedError("connection closed before the end of the response header")
+            header_end = self.buffer.find(b'\r\n\r\n')
+        self.head = bytes(self.buffer[:header_end])
+        del self.buffer[:header_end + 4]
+
+        lines = self.head.decode("iso-8859-1").split('\r\n')
+        self.status_line = lines[0]
+        status = self.status_line.split(' ')
+        self.status_code = int(status[1]) if len(status) > 1 and status[1].isdigit() else None
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        return self
+
+    def body_chunks(self):
+        """body_chunks yields the body (bytes) by chunks as they are received.
+
+            Raises:
+                ConnectionAbortedError: if the connection closed before the end of the body.
+        """
+        if self.status_code in BODYLESS_STATUSES or (self.status_code or 200) < 200:
+            self.complete = True
+            return
+        if 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            yield from self.chunked_body()
+        elif 'content-length' in self.headers:
+            yield from self.sized_body(int(self.headers['content-length']))
+        else:
+            # the body lasts until the server closes the connection
+            yield from self.sized_body(None)
+            return
+        self.complete = True
+
+    def keeps_alive(self):
+        """keeps_alive tells if the server leaves the connection open after this response."""
+        return self.headers.get('connection', '').lower() == 'keep-alive'
+
+    def sized_body(self, remaining):
+        # remaining bytes of the body, None for all of them until the end of the connection
+        while remaining is None or remaining > 0:
+            if not self.buffer and not self.fill():
+                if remaining is None:
+                    return
+                raise ConnectionAbortedError("connection closed before the end of the response body")
+            chunk = bytes(self.buffer[:remaining])
+            del self.buffer[:len(chunk)]
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    def chunked_body(self):
+        # chunk-size (hex) [; extensions] CRLF chunk-data CRLF ... 0 CRLF [trailers] CRLF
+        while True:
+            size = int(self.read_line().split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            yield from self.sized_body(size)
+            self.read_line()
+        while self.read_line():
+            pass
+
+    def read_line(self):
+        line_end = self.buffer.find(b'\r\n')
+        while line_end == -1:
+            if not self.fill():
+                raise ConnectionAbortedError("connection closed before the end of the chunked body")
+            line_end = self.buffer.find(b'\r\n')
+        line = bytes(self.buffer[:line_end])
+        del self.buffer[:line_end + 2]
+        return line
+
+    def fill(self):
+        data = self.sock.recv(RECV_SIZE)
+        self.buffer += data
+        return bool(data)
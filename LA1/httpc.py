@@ -1,8 +1,11 @@
 import argparse
+import json
 from argparse import RawTextHelpFormatter as rtf
 import sys
 from console_messages import HttpcManuals
-from libhttpc import HttpcRequests
+from libhttpc import HttpcRequests, HttpcBatch, SegmentedDownload, read_batch_requests, DEFAULT_CONCURRENCY
+from libbench import HttpcBench, format_report, DEFAULT_CONNECTIONS
+from response_cache import ResponseCache
 
 #print(HttpcManuals.LOGO)
 #print(HttpcManuals.WELCOME)
@@ -56,7 +59,13 @@ class HTTPC:
         parser.add_argument('-h', '--headers', action='extend', nargs='*', metavar='key:value', help=HttpcManuals.H_HELP)
         parser.add_argument('URL', help='server host')
         parser.add_argument('-o', '--output', help=HttpcManuals.O_HELP)
+        parser.add_argument('--segments', type=int, default=1, metavar='N', help=HttpcManuals.SEGMENTS_HELP)
+        parser.add_argument('--no-cache', action='store_true', dest='no_cache', help=HttpcManuals.NO_CACHE_HELP)
         args = parser.parse_args(sys.argv[2:])  # sys.argv[0] = httpc.py, sys.argv[1] = get
+        if args.segments < 1:
+            parser.error("--segments must be at least 1")
+        if args.segments > 1 and not args.output:
+            parser.error("--segments requires -o")
 
         self.url = args.URL
         self.headers = args.headers
@@ -67,8 +76,24 @@ class HTTPC:
         if self.headers:
             self.convert_headers_to_dict()
 
+        # Download the file as byte ranges in parallel, or as a single response if the server does not serve ranges of it
+        if args.segments > 1:
+            try:
+                complete = SegmentedDownload(self.url, self.output_file, args.segments, self.headers, self.verbose).run()
+            except KeyboardInterrupt:
+                print("!!! Download interrupted, run it again to resume")
+                sys.exit(1)
+            except OSError:
+                print("!!! Client Connection Failed")
+                sys.exit(1)
+            except ValueError as err:
+                print(">>> {}, downloading it as a single response".format(err))
+            else:
+                sys.exit(0 if complete else 1)
+
         # Register information to create request messages and send GET request
-        request_messages = HttpcRequests(url=self.url, headers=self.headers, verbose=self.verbose, output_file=self.output_file)
+        request_messages = HttpcRequests(url=self.url, headers=self.headers, verbose=self.verbose, output_file=self.output_file,
+                                         cache=None if args.no_cache else ResponseCache())
         request_messages.GET()
 
 
@@ -105,6 +130,77 @@ class HTTPC:
             request_messages.POST()
 
 
+    def batch(self):
+        parser = argparse.ArgumentParser(prog='httpc', conflict_handler='resolve', usage=argparse.SUPPRESS, description=HttpcManuals.BATCH_HELP, epilog=HttpcManuals.BATCH_EPILOG, formatter_class=rtf)
+        parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY, help=HttpcManuals.C_HELP)
+        parser.add_argument('-o', '--output-dir', default='', dest='output_dir', help=HttpcManuals.OUTPUT_DIR_HELP)
+        parser.add_argument('-r', '--results', default='', help=HttpcManuals.RESULTS_HELP)
+        parser.add_argument('requests_file', nargs='?', default='-', metavar='REQUESTS-FILE', help='file listing the requests (- for the standard input)')
+        args = parser.parse_args(sys.argv[2:])
+
+        if args.concurrency < 1:
+            parser.error("-c/--concurrency must be at least 1")
+
+        try:
+            if args.requests_file == '-':
+                requests = read_batch_requests(sys.stdin)
+            else:
+                with open(args.requests_file, encoding='utf-8') as requests_file:
+                    requests = read_batch_requests(requests_file)
+        except (OSError, ValueError) as error:
+            print("!!! httpc error: {}".format(error))
+            sys.exit(1)
+
+        # body files are looked up in the inputs directory, as with post -f
+        for request in requests:
+            if request['body_file']:
+                request['body_file'] = INPUTS_DIR + request['body_file']
+                self.file_is_valid(request['body_file'])
+
+        results = HttpcBatch(requests, args.concurrency, args.output_dir, args.results).run()
+        if args.results:
+            failed = sum(1 for result in results if result['error'])
+            print(">>> {} requests executed ({} failed), results recorded in {}".format(len(results), failed, args.results))
+
+
+    def bench(self):
+        parser = argparse.ArgumentParser(prog='httpc', conflict_handler='resolve', usage=argparse.SUPPRESS, description=HttpcManuals.BENCH_HELP, formatter_class=rtf)
+        parser.add_argument('-c', '--connections', type=int, default=DEFAULT_CONNECTIONS, help=HttpcManuals.CONNECTIONS_HELP)
+        length = parser.add_mutually_exclusive_group()
+        length.add_argument('-d', '--duration', type=float, help=HttpcManuals.DURATION_HELP)
+        length.add_argument('-n', '--requests', type=int, help=HttpcManuals.REQUESTS_HELP)
+        parser.add_argument('--mode', choices=['closed', 'open'], default='closed', help=HttpcManuals.MODE_HELP)
+        parser.add_argument('--rate', type=float, help=HttpcManuals.RATE_HELP)
+        parser.add_argument('--post-ratio', type=float, default=0, dest='post_ratio', help=HttpcManuals.POST_RATIO_HELP)
+        parser.add_argument('--post-url', default='', dest='post_url', help=HttpcManuals.POST_URL_HELP)
+        parser.add_argument('--post-data', default='', dest='post_data', help=HttpcManuals.POST_DATA_HELP)
+        parser.add_argument('--json', default='', help=HttpcManuals.JSON_HELP)
+        parser.add_argument('URL', help='server host')
+        args = parser.parse_args(sys.argv[2:])
+
+        if args.connections < 1:
+            parser.error("-c/--connections must be at least 1")
+        if args.duration is not None and args.duration <= 0:
+            parser.error("-d/--duration must be positive")
+        if args.requests is not None and args.requests < 1:
+            parser.error("-n/--requests must be at least 1")
+        if args.mode == 'open' and not (args.rate and args.rate > 0):
+            parser.error("--mode open needs a positive --rate")
+        if not 0 <= args.post_ratio <= 1:
+            parser.error("--post-ratio must be between 0 and 1")
+
+        report = HttpcBench(args.URL, args.connections, args.duration, args.requests, args.mode, args.rate,
+                            args.post_ratio, args.post_url, args.post_data).run()
+        if args.json == '-':
+            print(json.dumps(report, indent=2))
+            return
+        print(format_report(report))
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as json_file:
+                json.dump(report, json_file, indent=2)
+            print(">>> The report is recorded in {}".format(args.json))
+
+
     # Custom help CLI argument
     def help(self):
         parser = argparse.ArgumentParser(prog='httpc', conflict_handler='resolve', usage=argparse.SUPPRESS, add_help=False, description=HttpcManuals.HELP, epilog=HttpcManuals.HELP_EPILOG, formatter_class=rtf)
@@ -116,6 +212,10 @@ class HTTPC:
             print(HttpcManuals.GET_HELP_CUSTOM)
         elif args.command == 'post':
             print(HttpcManuals.POST_HELP_CUSTOM)
+        elif args.command == 'batch':
+            print(HttpcManuals.BATCH_HELP_CUSTOM)
+        elif args.command == 'bench':
+            print(HttpcManuals.BENCH_HELP_CUSTOM)
         else:
             print('!!! httpc error: unrecognized arguments:', args.command)
             print()
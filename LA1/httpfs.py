@@ -1,25 +1,49 @@
 import argparse
 from argparse import RawTextHelpFormatter as rtf
 from console_messages import HttpfsManuals
-from libhttpfs import run_server
+from libhttpfs import run_server, run_async_server, run_prefork_server, \
+    DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_BACKLOG, DEFAULT_PROCESSES
 
 class HTTPFS:
     def __init__(self):
         self.verbose = False
         self.port = 8007  # DEFAULT PORT
         self.directory = ''
+        self.workers = DEFAULT_WORKERS
+        self.queue_size = DEFAULT_QUEUE_SIZE
+        self.backlog = DEFAULT_BACKLOG
+        self.engine = 'threads'
+        self.processes = DEFAULT_PROCESSES
 
         parser = argparse.ArgumentParser(prog='httpfs', conflict_handler='resolve', usage=argparse.SUPPRESS, description=HttpfsManuals.HELP, formatter_class=rtf)
         parser.add_argument('-v', '--verbose', action='store_true', help=HttpfsManuals.V_HELP)
         parser.add_argument('-p', '--port', type=int, default=self.port, help=HttpfsManuals.P_HELP)
         parser.add_argument('-d', '--directory', type=str, help=HttpfsManuals.D_HELP)
+        parser.add_argument('--workers', type=int, default=self.workers, help=HttpfsManuals.WORKERS_HELP)
+        parser.add_argument('--queue-size', type=int, default=self.queue_size, dest='queue_size', help=HttpfsManuals.QUEUE_SIZE_HELP)
+        parser.add_argument('--backlog', type=int, default=self.backlog, help=HttpfsManuals.BACKLOG_HELP)
+        parser.add_argument('--engine', choices=['threads', 'async'], default=self.engine, help=HttpfsManuals.ENGINE_HELP)
+        parser.add_argument('--processes', type=int, default=self.processes, help=HttpfsManuals.PROCESSES_HELP)
         args = parser.parse_args()
+        if min(args.workers, args.queue_size, args.backlog, args.processes) < 1:
+            parser.error('--workers, --queue-size, --backlog and --processes must be at least 1')
 
         self.verbose = args.verbose
         self.port = args.port
         self.directory = args.directory
+        self.workers = args.workers
+        self.queue_size = args.queue_size
+        self.backlog = args.backlog
+        self.engine = args.engine
+        self.processes = args.processes
 
-        run_server('', self.port, self.directory, self.verbose)
+        if self.processes > 1:
+            run_prefork_server('', self.port, self.directory, self.verbose, self.processes, self.engine,
+                               self.workers, self.queue_size, self.backlog)
+        elif self.engine == 'async':
+            run_async_server('', self.port, self.directory, self.verbose, self.workers, self.backlog)
+        else:
+            run_server('', self.port, self.directory, self.verbose, self.workers, self.queue_size, self.backlog)
 
 
 
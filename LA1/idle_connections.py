@@ -0,0 +1,77 @@
+import selectors
+import socket
+import threading
+import time
+
+
+class IdleConnections:
+    """
+    IdleConnections holds the keep-alive connections of httpfs between two requests, so that they do not
+    keep a worker thread while their client is silent: a selector thread watches all of them, and hands
+    a connection back (on_ready) as soon as its next request starts arriving.
+
+    A connection which stays idle for timeout seconds is closed.
+    """
+
+    def __init__(self, on_ready, timeout, verbose=False):
+        self.on_ready = on_ready
+        self.timeout = timeout
+        self.verbose = verbose
+        self.selector = selectors.DefaultSelector()
+        # connections added by the workers, registered by the selector thread (the only one using the selector)
+        self.added = []
+        self.lock = threading.Lock()
+        # wakes the selector thread up when a connection is added
+        self.waker, self.wakeup_socket = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wakeup_socket.setblocking(False)
+        self.selector.register(self.wakeup_socket, selectors.EVENT_READ)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def add(self, conn, addr, state):
+        """add parks a connection until its client sends something, state is given back to on_ready along with it."""
+        with self.lock:
+            self.added.append((conn, addr, state))
+        try:
+            self.waker.send(b'\0')
+        except BlockingIOError:
+            # the selector thread has wake-ups pending already
+            pass
+
+    def run(self):
+        while True:
+            for key, _ in self.selector.select(self.time_to_next_expiry()):
+                if key.fileobj is self.wakeup_socket:
+                    self.drain_wakeups()
+                    continue
+                self.selector.unregister(key.fileobj)
+                conn, addr, state, _ = key.data
+                self.on_ready(conn, addr, state)
+
+            now = time.monotonic()
+            with self.lock:
+                added, self.added = self.added, []
+            for conn, addr, state in added:
+                self.selector.register(conn, selectors.EVENT_READ, (conn, addr, state, now))
+            self.expire(now)
+
+    def time_to_next_expiry(self):
+        idle_since = [key.data[3] for key in self.selector.get_map().values() if key.data]
+        if not idle_since:
+            return None
+        return max(min(idle_since) + self.timeout - time.monotonic(), 0)
+
+    def expire(self, now):
+        for key in list(self.selector.get_map().values()):
+            if key.data and now - key.data[3] >= self.timeout:
+                conn, addr, _, _ = key.data
+                self.selector.unregister(conn)
+                conn.close()
+                print("* Client {} idle for too long, connection closed".format(addr)) if self.verbose else ''
+
+    def drain_wakeups(self):
+        try:
+            while self.wakeup_socket.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
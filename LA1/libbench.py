@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from collections import Counter
+from connection_pool import ConnectionPool
+from libhttpc import HttpcRequests
+
+# connections driving the server at once, and how long a benchmark runs (in seconds) unless
+# a number of requests is given instead
+DEFAULT_CONNECTIONS = 8
+DEFAULT_DURATION = 10
+# latency percentiles reported
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """
+    LatencyHistogram records latencies (in microseconds) in log-linear buckets, the way an HDR histogram does:
+    exact up to 127us, then 64 buckets per power of two. Any percentile is within 1/64 (1.6%) of the
+    recorded value whatever the range, and the memory used does not depend on the number of requests.
+    """
+
+    SUB_BUCKET_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+
+    def __init__(self):
+        # bucket index -> count
+        self.counts = Counter()
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.counts[self.bucket_index(value)] += 1
+        self.total += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+        self.sum += value
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sum += other.sum
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def percentile(self, percentile):
+        """percentile returns the value (highest equivalent value of its bucket) below which percentile % of the records are."""
+        if not self.total:
+            return 0
+        rank = max(int(self.total * percentile / 100 + 0.5), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_high(index), self.max)
+        return self.max
+
+    def buckets(self):
+        """buckets returns the [highest equivalent value, count] of the buckets recorded, by value."""
+        return [[self.bucket_high(index), self.counts[index]] for index in sorted(self.counts)]
+
+    @classmethod
+    def bucket_index(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        return cls.SUB_BUCKETS + (shift - 1) * cls.HALF_SUB_BUCKETS + (value >> shift) - cls.HALF_SUB_BUCKETS
+
+    @classmethod
+    def bucket_high(cls, index):
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift, sub_bucket = divmod(index - cls.SUB_BUCKETS, cls.HALF_SUB_BUCKETS)
+        return ((sub_bucket + cls.HALF_SUB_BUCKETS + 1) << (shift + 1)) - 1
+
+
+class HttpcBench:
+    """
+    HttpcBench drives a URL of the server with a number of persistent connections, for a duration
+    or a number of requests, and measures the latency of every request.
+
+    closed loop: each connection sends its next request as soon as the response of the previous one is in,
+        so the load adapts to the server (latency under the highest throughput it sustains).
+    open loop: requests are due at a fixed rate whatever the server does, and their latency counts from
+        the time they were due, so a server falling behind shows in the latency (no coordinated omission).
+    """
+
+    def __init__(self, url, connections=DEFAULT_CONNECTIONS, duration=None, requests=None, mode='closed', rate=None,
+                 post_ratio=0, post_url='', post_data=''):
+        self.url = url
+        self.connections = connections
+        self.duration = duration if duration or requests else DEFAULT_DURATION
+        self.requests = requests
+        self.mode = mode
+        self.rate = rate
+        self.post_ratio = post_ratio
+        self.post_url = post_url or url
+        self.post_data = post_data
+        self.pool = ConnectionPool(max_idle=connections, max_per_host=connections)
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.started_at = None
+        self.deadline = None
+
+    def run(self):
+        """run runs the benchmark and returns its report (dict, see report)."""
+        workers = [Worker(self, seed) for seed in range(self.connections)]
+        threads = [threading.Thread(target=worker.run, daemon=True) for worker in workers]
+        self.started_at = time.perf_counter()
+        self.deadline = self.started_at + self.duration if self.duration else None
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - self.started_at
+        self.pool.close()
+        return self.report(workers, elapsed)
+
+    def next_request(self):
+        # (index of the next request, time it is due), or None once the benchmark is over
+        with self.lock:
+            index = self.next_index
+            if self.requests is not None and index >= self.requests:
+                return None
+            self.next_index += 1
+        due_at = self.started_at + index / self.rate if self.mode == 'open' else time.perf_counter()
+        if self.deadline is not None and due_at >= self.deadline:
+            return None
+        return index, due_at
+
+    def report(self, workers, elapsed):
+        histogram = LatencyHistogram()
+        methods, statuses, errors = Counter(), Counter(), Counter()
+        for worker in workers:
+            histogram.merge(worker.histogram)
+            methods.update(worker.methods)
+            statuses.update(worker.statuses)
+            errors.update(worker.errors)
+        completed = sum(statuses.values())
+        return {
+            'url': self.url,
+            'mode': self.mode,
+            'connections': self.connections,
+            'rate': self.rate,
+            'post_ratio': self.post_ratio,
+            'elapsed': round(elapsed, 6),
+            'requests': completed + sum(errors.values()),
+            'methods': dict(methods),
+            'throughput': round(completed / elapsed, 3) if elapsed else 0,
+            'latency_ms': dict(
+                [('min', (histogram.min or 0) / 1000), ('mean', round(histogram.mean() / 1000, 3))] +
+                [('p{:g}'.format(percentile).replace('.', ''), histogram.percentile(percentile) / 1000)
+                 for percentile in PERCENTILES] +
+                [('max', histogram.max / 1000)]
+            ),
+            'statuses': {str(status): count for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+            'errors': dict(errors),
+            # [highest equivalent latency (us), count] of the histogram buckets
+            'histogram': histogram.buckets(),
+        }
+
+
+class Worker:
+    """
+    Worker is one connection of a benchmark: it sends requests one after the other,
+    with its own histogram and counters (merged once the benchmark is over).
+    """
+
+    def __init__(self, bench, seed):
+        self.bench = bench
+        self.random = random.Random(seed)
+        self.histogram = LatencyHistogram()
+        self.methods = Counter()
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def run(self):
+        bench = self.bench
+        while True:
+            next_request = bench.next_request()
+            if next_request is None:
+                return
+            _, due_at = next_request
+            # open loop: wait until the request is due (it is late already if the server fell behind)
+            delay = due_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            if self.random.random() < bench.post_ratio:
+                method, request = 'POST', HttpcRequests(bench.post_url, post_inline_data=bench.post_data, pool=bench.pool)
+            else:
+                method, request = 'GET', HttpcRequests(bench.url, pool=bench.pool)
+            self.methods[method] += 1
+            try:
+                status, _ = request.fetch(method)
+            except Exception as error:
+                self.errors[type(error).__name__] += 1
+                continue
+            self.histogram.record((time.perf_counter() - due_at) * 1000000)
+            self.statuses[status] += 1
+
+
+def format_report(report):
+    """format_report returns the report of a benchmark as text for the console."""
+    latency = report['latency_ms']
+    lines = [
+        ">>> {} ({}-loop, {} connections{}), {} requests in {:.2f}s".format(
+            report['url'], report['mode'], report['connections'],
+            ", {} req/s due".format(report['rate']) if report['mode'] == 'open' else '',
+            report['requests'], report['elapsed']),
+        "    methods: {}".format(', '.join("{} {}".format(count, method) for method, count in report['methods'].items()) or '-'),
+        "    throughput: {:.1f} responses/s".format(report['throughput']),
+        "    latency (ms): " + '  '.join("{} {:.3f}".format(name, value) for name, value in latency.items()),
+        "    statuses: {}".format(', '.join("{}: {}".format(status, count) for status, count in report['statuses'].items()) or '-'),
+        "    errors: {}".format(', '.join("{}: {}".format(error, count) for error, count in report['errors'].items()) or '-'),
+    ]
+    return '\n'.join(lines)
@@ -1,6 +1,15 @@
+import codecs
+import os
+import shlex
 import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 import json
+from connection_pool import ConnectionPool
+from http_message import ResponseReader
 
 # 1. HTTP client initiates TCP connection to HTTP server (process) at {link} on port {num}
 # 1s. HTTP server at host {link} waiting for TCP connection at port {num}
@@ -16,10 +25,17 @@ import json
 
 OUTPUTS_DIR = './outputs/'
 DEFAULT_USER_AGENT = 'Concordia-HTTP/1.0'
+# requests of a batch running at once
+DEFAULT_CONCURRENCY = 8
+# segmented downloads: segments fetched in parallel, the file recording the bytes received of each one
+# (next to the output file), and how often it is updated (in seconds)
+DEFAULT_SEGMENTS = 4
+PROGRESS_FILE_SUFFIX = '.progress'
+PROGRESS_SAVE_INTERVAL = 0.5
 
 class HttpcRequests:
 
-    def __init__(self, url, headers='', post_inline_data='', post_input_file='', verbose=False, output_file='', DEFAULT_PORT=80): # Standard HTTP/TCP port is 80
+    def __init__(self, url, headers='', post_inline_data='', post_input_file='', verbose=False, output_file='', DEFAULT_PORT=80, pool=None, cache=None): # Standard HTTP/TCP port is 80
         self.request_method = None  # To initialize request method: GET / POST
         self.request_message = ''   # To send full request lines to the host
         self.parsed_url = urlparse(url) # Parse URL
@@ -34,6 +50,12 @@ class HttpcRequests:
         self.post_input_file = post_input_file # in json
         self.body = ''
         self.output_file = output_file
+        # ConnectionPool shared by the requests to reuse connections (HTTP/1.1 keep-alive), one connection per request otherwise
+        self.pool = pool
+        self.protocol_ver = 'HTTP/1.1' if pool else 'HTTP/1.0'
+        # ResponseCache the responses to GET are kept in and revalidated from, and the metadata of the one kept for the URL
+        self.cache = cache
+        self.cached = None
 
         #self.scheme = self.parsed_url.scheme
         #self.netloc = self.parsed_url.netloc
@@ -72,87 +94,418 @@ class HttpcRequests:
         return self.body
         
     
-    def output_to_file(self, response):
+    def output_to_file(self, body_chunks):
+        # the body goes to the file as it arrives, it is never all in memory
         self.output_file = OUTPUTS_DIR + self.output_file
         try:
-            f = open(self.output_file, "w")
-            f.write(response)
-        except:
+            f = open(self.output_file, "wb")
+        except OSError:
             print("!!! The error occured while outputting to file.")
-            print(response)
-        finally:
-            f.close()
+            self.output_to_console(body_chunks)
+            return
+        with f:
+            for chunk in body_chunks:
+                f.write(chunk)
+
+
+    def output_to_console(self, body_chunks):
+        # a character may be split between two chunks
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in body_chunks:
+            print(decoder.decode(chunk), end='')
+        print(decoder.decode(b'', final=True))
 
 
     def run_client(self):
-        # open and set up client socket
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            # connect to the server(host) at port num given
-            client_socket.connect((self.hostname, self.port))
-            # send request message to server
-            client_socket.sendall(self.request_message.encode("utf-8"))
-            # receive response data from server
-            # MSG_WAITALL waits for full request or error
-            response = client_socket.recv(4096).decode()
-            # Divide response into header (verbose) and body
-            response_header = response[:response.find('\r\n\r\n')].replace('\r\n\r\n', '')
-            response_body = response[response.find('\r\n\r\n'):].replace('\r\n\r\n', '')
-
-            # Output response message
-            print("[Replied]")
-            if self.verbose:
-                print(response_header)
-                print('\n')
-            if self.output_file:
-                self.output_to_file(response_body)
-                print(">>> The response is recorded in {}".format(self.output_file))
-            else:
-                print(response_body)
+            # send request message to server and output the response data from server as it is received
+            self.send_request()
         except:
             print("!!! Client Connection Failed")
-        finally:
-            # close the connection
-            client_socket.close()
+
+
+    def output_response(self, response):
+        # Output response message: header (verbose), then body
+        print("[Replied]")
+        if self.verbose:
+            print(response.head.decode("utf-8", errors="replace"))
+            print('\n')
+        body_chunks = self.response_body_chunks(response)
+        if self.verbose and response.status_code == 304 and self.cached:
+            print(">>> Not modified, the response kept in the cache is output")
+        if self.output_file:
+            self.output_to_file(body_chunks)
+            print(">>> The response is recorded in {}".format(self.output_file))
+        else:
+            self.output_to_console(body_chunks)
+
+
+    def response_body_chunks(self, response):
+        # the body of the response, or the one kept in the cache if the server tells it did not change
+        if not self.cache or self.request_method != 'GET' or 'Range' in self.headers:
+            return response.body_chunks()
+        url = self.parsed_url.geturl()
+        if response.status_code == 304 and self.cached:
+            for _ in response.body_chunks():
+                pass
+            return self.cache.body_chunks(url)
+        if self.cache.is_cacheable(response):
+            return self.cache.store(url, response)
+        if response.status_code in (200, 404):
+            # the response kept is not the current one anymore
+            self.cache.remove(url)
+        return response.body_chunks()
+
+
+    def send_request(self, handle_response=None):
+        # the response is output as it is received, unless handle_response takes it (its result is returned)
+        handle_response = handle_response or self.output_response
+        if not self.pool:
+            # open and set up client socket
+            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                # connect to the server(host) at port num given
+                client_socket.connect((self.hostname, self.port))
+                client_socket.sendall(self.request_message.encode("utf-8"))
+                return handle_response(ResponseReader(client_socket).read_head())
+            finally:
+                # close the connection
+                client_socket.close()
+
+        # a connection of the pool, kept for the next request if the server keeps it alive
+        while True:
+            client_socket, reused = self.pool.acquire(self.hostname, self.port)
+            response = ResponseReader(client_socket)
+            try:
+                try:
+                    client_socket.sendall(self.request_message.encode("utf-8"))
+                    response.read_head()
+                except ConnectionError:
+                    # the server closed it since the previous request on it: send the request again on another one
+                    if reused:
+                        continue
+                    raise
+                return handle_response(response)
+            finally:
+                self.pool.release(self.hostname, self.port, client_socket, response.complete and response.keeps_alive())
 
 
     def GET(self):
+        self.create_get_message()
+
+        print("[Sent]")
+        print(self.request_message)
+
+        self.run_client()
+        #return self.request_message
+
+
+    def POST(self):
+        self.create_post_message()
+
+        print("[Sent]")
+        print(self.request_message)
+
+        self.run_client()
+        #return self.request_message
+
+
+    def fetch(self, method='GET', body_file=None):
+        """fetch sends the request without printing anything (batch and library use).
+
+            Args:
+                method: 'GET' or 'POST'.
+                body_file: binary file object the body of the response is written to, discarded if None.
+
+            Returns:
+                (status code, size of the body in bytes) of the response.
+        """
+        if method.upper() == 'POST':
+            self.create_post_message()
+        else:
+            self.create_get_message()
+        return self.send_request(lambda response: self.save_response(response, body_file))
+
+
+    def save_response(self, response, body_file):
+        body_size = 0
+        for chunk in self.response_body_chunks(response):
+            body_size += len(chunk)
+            if body_file:
+                body_file.write(chunk)
+        return response.status_code, body_size
+
+
+    def create_get_message(self):
         self.request_method = 'GET'
 
         # Request-URI = [ path ][ "?" query ]
         request_uri = "{}?{}".format(self.path, self.query) if self.query else self.path
         # Request-Line = Method SP Request-URI SP HTTP-Version CRLF
-        request_line = "GET {} HTTP/1.0\r\n".format(request_uri)
+        request_line = "GET {} {}\r\n".format(request_uri, self.protocol_ver)
+        # revalidate the response kept in the cache (unless the validators were given, or only bytes of it are requested)
+        if self.cache and not any(name in (self.headers or {}) for name in ('Range', 'If-None-Match', 'If-Modified-Since')):
+            self.cached = self.cache.lookup(self.parsed_url.geturl())
+            if self.cached:
+                self.headers = dict(self.headers or {}, **self.cache.conditional_headers(self.cached))
         # Request-Heaer = Headers CRLF User-Agent CRLF
         request_headers = self.create_request_headers()
         self.request_message = "{}{}\r\n".format(request_line, request_headers)
 
-        print("[Sent]")
-        print(self.request_message)
-
-        self.run_client()
-        #return self.request_message
-
 
-    def POST(self):
+    def create_post_message(self):
         self.request_method = 'POST'
 
         # Request-URI = [ path ][ "?" query ]
         request_uri = "{}?{}".format(self.path, self.query) if self.query else self.path
         # Request-Line = Method SP Request-URI SP HTTP-Version CRLF
-        request_line = "POST {} HTTP/1.0\r\n".format(request_uri)
+        request_line = "POST {} {}\r\n".format(request_uri, self.protocol_ver)
         # Request-Heaer = Headers CRLF User-Agent CRLF
         request_headers = self.create_request_headers()
         # Request-Body
         request_body = self.create_request_body()
+        # the server finds the end of the body from its length (the connection may carry more requests)
+        if 'Content-Length' not in self.headers:
+            request_headers += 'Content-Length:{}\r\n'.format(len(request_body.encode("utf-8")))
 
         self.request_message = "{}{}\r\n{}\r\n".format(request_line, request_headers, request_body)
 
-        print("[Sent]")
-        print(self.request_message)
 
-        self.run_client()
-        #return self.request_message
+
+class SegmentedDownload:
+    """
+    SegmentedDownload fetches a file as segments (byte ranges) in parallel, each one over its own connection,
+    written with positional writes into the output file, preallocated to the size of the file.
+
+    The bytes received of each segment are recorded in a progress file next to the output file
+    (removed once the download is complete), so that an interrupted download resumes where it stopped.
+    The validator of the file (ETag or Last-Modified) is recorded along with them and sent with each segment
+    (If-Range): bytes of another version of the file are never added to the ones received.
+    """
+
+    def __init__(self, url, output_file, segments=DEFAULT_SEGMENTS, headers=None, verbose=False):
+        self.url = url
+        self.output_file = OUTPUTS_DIR + output_file
+        self.progress_file = self.output_file + PROGRESS_FILE_SUFFIX
+        self.segments = segments
+        self.headers = dict(headers or {})
+        self.verbose = verbose
+        # ETag or Last-Modified of the file downloaded ('' if the server sends none)
+        self.validator = ''
+        # [first, last, bytes received] of each segment
+        self.ranges = []
+        self.lock = threading.Lock()
+        self.saved_at = 0
+        self.errors = []
+
+    def run(self):
+        """run downloads the file (or what is left of it), returns True if it is complete.
+
+            Raises:
+                ValueError: if the server does not serve byte ranges of the file.
+        """
+        size, self.validator = self.probe()
+        self.ranges = self.load_progress(size) or self.split(size)
+        print(">>> {} bytes in {} segments{}".format(
+            size, len(self.ranges), ", resuming with {} bytes left".format(self.remaining()) if self.saved_at else ''))
+
+        fd = os.open(self.output_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+                if hasattr(os, 'posix_fallocate') and size:
+                    os.posix_fallocate(fd, 0, size)
+            threads = [threading.Thread(target=self.fetch_segment, args=(fd, segment), daemon=True)
+                       for segment in self.ranges if segment[0] + segment[2] <= segment[1]]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    thread.join()
+            finally:
+                # on ctrl-C as well: what was received so far is kept for the next run
+                with self.lock:
+                    self.save_progress()
+        finally:
+            os.close(fd)
+
+        for error in self.errors:
+            print("!!! Segment failed: {}".format(error))
+        if self.remaining():
+            print("!!! Download incomplete ({} bytes left), run it again to resume".format(self.remaining()))
+            return False
+        os.remove(self.progress_file)
+        return True
+
+    def probe(self):
+        # the first byte tells the size of the whole file (Content-Range: bytes 0-0/size) and its validator
+        # (a weak ETag cannot be sent with If-Range)
+        def read_size(response):
+            total = response.headers.get('content-range', '').rpartition('/')[2]
+            if response.status_code not in (206, 416) or not total.isdigit():
+                raise ValueError("{} does not serve byte ranges ({})".format(self.url, response.status_line))
+            for _ in response.body_chunks():
+                pass
+            etag = response.headers.get('etag', '')
+            return int(total), etag if etag and not etag.startswith('W/') else response.headers.get('last-modified', '')
+        return self.range_request('bytes=0-0').send_request(read_size)
+
+    def split(self, size):
+        segment_size = max(-(-size // self.segments), 1)
+        return [[first, min(first + segment_size, size) - 1, 0] for first in range(0, size, segment_size)]
+
+    def fetch_segment(self, fd, segment):
+        first, last, _ = segment
+
+        def write_body(response):
+            position = first + segment[2]
+            if response.status_code == 200 and self.validator:
+                # If-Range did not match: the file changed on the server since the download started
+                raise ValueError("{} changed during the download, run it again to start over".format(self.url))
+            if response.status_code != 206 or \
+                    not response.headers.get('content-range', '').startswith('bytes {}-'.format(position)):
+                raise ValueError("unexpected response to bytes {}-{}: {}".format(position, last, response.status_line))
+            for chunk in response.body_chunks():
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+                with self.lock:
+                    segment[2] = position - first
+                    if time.monotonic() - self.saved_at > PROGRESS_SAVE_INTERVAL:
+                        self.save_progress()
+
+        try:
+            self.range_request('bytes={}-{}'.format(first + segment[2], last)).send_request(write_body)
+            if self.verbose:
+                print(">>> Segment bytes {}-{} received".format(first, last))
+        except Exception as error:
+            self.errors.append("bytes {}-{}: {!r}".format(first, last, error))
+
+    def range_request(self, byte_range):
+        headers = dict(self.headers, Range=byte_range)
+        if self.validator:
+            headers['If-Range'] = self.validator
+        request = HttpcRequests(self.url, headers=headers)
+        request.create_get_message()
+        return request
+
+    def remaining(self):
+        return sum(last + 1 - first - received for first, last, received in self.ranges)
+
+    def load_progress(self, size):
+        # the segments of an interrupted download of the same version of the file, None if there is none
+        try:
+            with open(self.progress_file, encoding='utf-8') as progress_file:
+                progress = json.load(progress_file)
+        except (OSError, ValueError):
+            return None
+        if progress.get('url') != self.url or progress.get('size') != size or \
+                progress.get('validator', '') != self.validator or \
+                not os.path.exists(self.output_file) or os.path.getsize(self.output_file) != size:
+            return None
+        self.saved_at = time.monotonic()
+        return progress['segments']
+
+    def save_progress(self):
+        # written aside then renamed, so that an interruption never leaves a truncated progress file
+        with open(self.progress_file + '.tmp', 'w', encoding='utf-8') as progress_file:
+            json.dump({'url': self.url, 'size': sum(last + 1 - first for first, last, _ in self.ranges),
+                       'validator': self.validator, 'segments': self.ranges}, progress_file)
+        os.replace(self.progress_file + '.tmp', self.progress_file)
+        self.saved_at = time.monotonic()
+
+
+def read_batch_requests(lines):
+    """read_batch_requests parses the list of requests of a batch, one per line.
+
+        A line is either a JSON object:
+            {"method": "POST", "url": "...", "headers": {"key": "value"}, "body_file": "...", "data": "..."}
+        or: METHOD URL [key:value ...]
+        Empty lines and lines starting with # are skipped.
+
+        Returns:
+            the list of requests (dict with method, url, headers, body_file, data).
+
+        Raises:
+            ValueError: if a line is not a valid request.
+    """
+    requests = []
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            request = json.loads(line)
+        else:
+            fields = shlex.split(line)
+            if len(fields) < 2:
+                raise ValueError("line {}: expected METHOD URL [key:value ...]".format(line_num))
+            headers = dict(field.split(':', 1) for field in fields[2:] if ':' in field)
+            request = {'method': fields[0], 'url': fields[1], 'headers': headers}
+        if not isinstance(request, dict) or 'url' not in request or \
+                request.get('method', 'GET').upper() not in ('GET', 'POST'):
+            raise ValueError("line {}: expected a GET or POST request with a url".format(line_num))
+        requests.append({
+            'method': request.get('method', 'GET').upper(),
+            'url': request['url'],
+            'headers': {key.strip(): str(val).strip() for key, val in (request.get('headers') or {}).items()},
+            'body_file': request.get('body_file', ''),
+            'data': request.get('data', ''),
+        })
+    return requests
+
+
+class HttpcBatch:
+    """
+    HttpcBatch runs many requests, at most concurrency of them at once, over pooled connections.
+
+    The body of each response is saved to output_dir (or discarded), and a result per request
+    (index, method, url, status, bytes, elapsed seconds, output file, error) is written as a JSON line
+    to results_file (or the console) as soon as the request is done.
+    """
+
+    def __init__(self, requests, concurrency=DEFAULT_CONCURRENCY, output_dir='', results_file='', pool=None):
+        self.requests = requests
+        self.concurrency = concurrency
+        self.output_dir = output_dir
+        self.results_file = results_file
+        self.pool = pool or ConnectionPool(max_idle=concurrency, max_per_host=concurrency)
+        self.results_lock = threading.Lock()
+
+    def run(self):
+        """run sends every request and returns their results, in the order of the requests."""
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        results_out = open(self.results_file, 'w', encoding='utf-8') if self.results_file else sys.stdout
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                return list(executor.map(lambda args: self.run_request(*args, results_out), enumerate(self.requests)))
+        finally:
+            if self.results_file:
+                results_out.close()
+            self.pool.close()
+
+    def run_request(self, index, request, results_out):
+        result = {'index': index, 'method': request['method'], 'url': request['url'],
+                  'status': None, 'bytes': 0, 'elapsed': None, 'output': None, 'error': None}
+        started_at = time.perf_counter()
+        try:
+            http_request = HttpcRequests(request['url'], headers=dict(request['headers']), post_inline_data=request['data'],
+                                         post_input_file=request['body_file'], pool=self.pool)
+            if self.output_dir:
+                name = os.path.basename(http_request.path.rstrip('/')) or 'index'
+                result['output'] = os.path.join(self.output_dir, "{:05d}_{}".format(index, name))
+                with open(result['output'], 'wb') as body_file:
+                    result['status'], result['bytes'] = http_request.fetch(request['method'], body_file)
+            else:
+                result['status'], result['bytes'] = http_request.fetch(request['method'])
+        except Exception as error:
+            result['error'] = repr(error)
+        result['elapsed'] = round(time.perf_counter() - started_at, 6)
+
+        with self.results_lock:
+            results_out.write(json.dumps(result) + '\n')
+            results_out.flush()
+        return result
 
 
 
@@ -1,6 +1,17 @@
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import signal
 import socket
 import threading
+import time
+import queue
 import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from file_cache import FileCache
+from idle_connections import IdleConnections
+from http_message import next_message, not_modified, parse_range, range_applies
 from wsgiref.handlers import format_date_time
 from datetime import datetime
 from time import mktime
@@ -15,6 +26,14 @@ STATUS_MESSAGE = {
     {
         'message': 'OK'
     },
+    206: 
+    {
+        'message': 'Partial Content'
+    },
+    304: 
+    {
+        'message': 'Not Modified'
+    },
     400: 
     {
         'message': 'Bad Request',
@@ -29,37 +48,316 @@ STATUS_MESSAGE = {
     {
         'message': 'File Not Found',
         'htmlbody': '<html><body><center style="padding: 20px"><h1>Error 404: File Not Found</h1></center></body></html>',
+    },
+    416: 
+    {
+        'message': 'Range Not Satisfiable',
+        'htmlbody': '<html><body><center style="padding: 20px"><h1>Error 416: Range Not Satisfiable</h1></center></body></html>',
+    },
+    503: 
+    {
+        'message': 'Service Unavailable',
+        'htmlbody': '<html><body><center style="padding: 20px"><h1>Error 503: Service Unavailable</h1></center></body></html>',
     }
 }
 # html body response depends on the user agent (default is user agent from terminal)
 DEFAULT_USER_AGENT = 'Concordia-HTTP/1.0'
+# worker pool: threads serving the connections, accepted connections waiting for a free worker
+# (beyond that the server is overloaded and answers 503 right away),
+# and connections the kernel holds until they are accepted (listen backlog)
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_BACKLOG = 128
+# a worker drops a connection which has been silent for this many seconds
+CONN_TIMEOUT = 10
+# persistent connections (HTTP/1.1, or HTTP/1.0 with Connection: keep-alive): how long one may stay
+# idle between two requests, and how many requests it serves before it is closed
+KEEPALIVE_TIMEOUT = 5
+MAX_KEEPALIVE_REQUESTS = 100
+# pre-fork mode: worker processes sharing the port, and how long a worker which exited
+# has to have run before it is restarted right away (so that a failing one does not spin)
+DEFAULT_PROCESSES = 1
+RESTART_DELAY = 1
+# stat metadata and content of the small files served, kept in memory (one cache per process)
+FILE_CACHE = FileCache()
+
 
+def run_server(host='', port=8007, directory='', verbose=True,
+               workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, backlog=DEFAULT_BACKLOG):
+    listener = create_listener(host, port, backlog)
+    print('\n\n* * * * * Server is listening at {} * * * * *'.format(port))
+    directory = assign_server_dir(directory, verbose)
+    serve_threads(listener, directory, verbose, workers, queue_size)
 
-def run_server(host='', port=8007, directory='', verbose=True):
+
+def create_listener(host, port, backlog, reuse_port=False):
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
+        # the server closes connections first (keep-alive): do not wait for their TIME_WAIT to restart
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # every worker process binds the same port, the kernel spreads the connections among them
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         listener.bind((host, port))
-        listener.listen(5)
-
-        print('\n\n* * * * * Server is listening at {} * * * * *'.format(port))
-
-        # if custom directory chosen then create new directory inside the global server folder
-        if directory:
-            directory = directory.replace('/', '')
-            directory = GLOBAL_SERVER_DIR + '/' + directory
-            if not os.path.exists(directory): # if custom directory does not exist
-                os.mkdir(directory)
-                print("New server folder '{}' created.".format(directory))
-            print("Server folder '{}' was assigned.".format(directory))
-        else: # if default directory chosen then 'server/default' server folder will be chosen.
-            directory = GLOBAL_SERVER_DIR + '/default'
-            print("Default server folder: '{}' was assigned.".format(directory)) if verbose else ''
+        listener.listen(backlog)
+    except OSError:
+        listener.close()
+        raise
+    return listener
+
+
+def serve_threads(listener, server_dir, verbose, workers, queue_size):
+    # accepted connections waiting for a free worker,
+    # and slots of the connections being served or waiting (a worker frees its slot when done)
+    connections = queue.Queue()
+    slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def queue_client(conn, addr, state=None):
+        if slots.acquire(blocking=False):
+            connections.put((conn, addr, state, True))
+        elif state is not None:
+            # a keep-alive client already admitted is not turned away in the middle of its connection
+            connections.put((conn, addr, state, False))
+        else:
+            reject_client(conn, addr, verbose)
+
+    # keep-alive connections wait for their next request there, without a worker (or a slot):
+    # they are queued again once it starts arriving
+    idle_connections = IdleConnections(queue_client, KEEPALIVE_TIMEOUT, verbose)
+    signal.signal(signal.SIGTERM, stop_server)
+    try:
+        # a fixed number of threads, however many clients connect at once
+        for _ in range(workers):
+            threading.Thread(target=serve_connections, args=(connections, slots, idle_connections, server_dir, verbose),
+                             daemon=True).start()
+        print("{} workers, up to {} connections queued".format(workers, queue_size)) if verbose else ''
 
         while True:
             conn, addr = listener.accept()
-            threading.Thread(target=handle_client, args=(conn, addr, directory, verbose)).start()
+            queue_client(conn, addr)
     finally:
+        # graceful shutdown: no new connection, the ones in progress get some time to finish
         listener.close()
+        deadline = time.monotonic() + CONN_TIMEOUT
+        for _ in range(workers + queue_size):
+            if not slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                break
+        print('* Server stopped') if verbose else ''
+        print_cache_stats() if verbose else ''
+
+
+def print_cache_stats():
+    hits, misses, entries, size = FILE_CACHE.stats()
+    print("* File cache: {} hits, {} misses, {} entries ({} bytes)".format(hits, misses, entries, size))
+
+
+def stop_server(signum, frame):
+    # SIGTERM: leave the accept loop, the way ctrl-C does
+    raise SystemExit(0)
+
+
+def assign_server_dir(directory, verbose):
+    # if custom directory chosen then create new directory inside the global server folder
+    if directory:
+        directory = directory.replace('/', '')
+        directory = GLOBAL_SERVER_DIR + '/' + directory
+        if not os.path.exists(directory): # if custom directory does not exist
+            os.mkdir(directory)
+            print("New server folder '{}' created.".format(directory))
+        print("Server folder '{}' was assigned.".format(directory))
+    else: # if default directory chosen then 'server/default' server folder will be chosen.
+        directory = GLOBAL_SERVER_DIR + '/default'
+        print("Default server folder: '{}' was assigned.".format(directory)) if verbose else ''
+    return directory
+
+
+def run_async_server(host='', port=8007, directory='', verbose=True,
+                     workers=DEFAULT_WORKERS, backlog=DEFAULT_BACKLOG):
+    directory = assign_server_dir(directory, verbose)
+    asyncio.run(serve_async(host, port, directory, verbose, workers, backlog))
+
+
+async def serve_async(host, port, server_dir, verbose, workers, backlog, reuse_port=False):
+    # one event loop holds every connection, an idle one only costs its socket and a suspended coroutine;
+    # the file system work of the requests runs on a pool of worker threads so that it never blocks the loop
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    stopping = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client_async(reader, writer, server_dir, verbose),
+        host, port, backlog=backlog, reuse_port=reuse_port
+    )
+    print('\n\n* * * * * Server is listening at {} * * * * *'.format(port))
+    print("Event loop engine, {} workers for file I/O, listen backlog of {}".format(workers, backlog)) if verbose else ''
+
+    async with server:
+        await stopping.wait()
+        # graceful shutdown: no new connection, the ones in progress get some time to finish
+        server.close()
+        clients = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if clients:
+            await asyncio.wait(clients, timeout=CONN_TIMEOUT)
+    print('* Server stopped') if verbose else ''
+    print_cache_stats() if verbose else ''
+
+
+def run_prefork_server(host='', port=8007, directory='', verbose=True, processes=DEFAULT_PROCESSES, engine='threads',
+                       workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, backlog=DEFAULT_BACKLOG):
+    # supervisor: every worker process has its own listener (SO_REUSEPORT) and accept loop, so the server
+    # is no longer bound to the single core of one interpreter; a worker which exits is started again
+    directory = assign_server_dir(directory, verbose)
+    args = (host, port, directory, verbose, engine, workers, queue_size, backlog)
+    children = [None] * processes
+    # time the worker of each slot which exited is to be started again at
+    restart_at = [0] * processes
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    print('\n\n* * * * * Server is listening at {} with {} processes * * * * *'.format(port, processes))
+
+    try:
+        while not stopping:
+            for index, child in enumerate(children):
+                if child is not None and not child.is_alive():
+                    # reaped, so that its sentinel (readable for good) is not waited on anymore;
+                    # one which exited too early is started again a while later, so that a failing one does not spin
+                    print("!!! Worker process {} exited with code {}, restarting it".format(child.pid, child.exitcode))
+                    restart_at[index] = child.started_at + RESTART_DELAY
+                    child.close()
+                    children[index] = None
+                if children[index] is None and time.monotonic() >= restart_at[index]:
+                    child = multiprocessing.Process(target=serve_process, args=args)
+                    child.start()
+                    child.started_at = time.monotonic()
+                    children[index] = child
+                    print("* Worker process {} started".format(child.pid)) if verbose else ''
+            # wake up as soon as a live worker exits, or once the earliest restart is due
+            # (at least every RESTART_DELAY, to notice ctrl-C)
+            pending = [restart_at[index] for index, child in enumerate(children) if child is None]
+            timeout = min([RESTART_DELAY] + [max(at - time.monotonic(), 0) for at in pending])
+            multiprocessing.connection.wait([child.sentinel for child in children if child is not None], timeout=timeout)
+    finally:
+        # graceful shutdown: every worker stops accepting and finishes the connections in progress
+        for child in children:
+            if child is not None and child.is_alive():
+                child.terminate()
+        for child in children:
+            if child is not None:
+                child.join(CONN_TIMEOUT + 1)
+                if child.is_alive():
+                    child.kill()
+        print('* Server stopped') if verbose else ''
+
+
+def serve_process(host, port, server_dir, verbose, engine, workers, queue_size, backlog):
+    # worker process: ctrl-C reaches the whole process group, only the supervisor handles it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if engine == 'async':
+        asyncio.run(serve_async(host, port, server_dir, verbose, workers, backlog, reuse_port=True))
+    else:
+        listener = create_listener(host, port, backlog, reuse_port=True)
+        serve_threads(listener, server_dir, verbose, workers, queue_size)
+
+
+async def handle_client_async(reader, writer, server_dir, verbose):
+    addr = writer.get_extra_info('peername')
+    print('\n\n==============================================')
+    print("* New client from {}".format(addr))
+    loop = asyncio.get_running_loop()
+    received = bytearray()
+    requests_served = 0
+    closed = False
+
+    try:
+        while True:
+            # the next request may already be in what was received (pipelined), or still be on its way
+            http_request_msg = next_message(received, closed)
+            if http_request_msg is None:
+                if closed:
+                    break
+                data = await asyncio.wait_for(reader.read(4096), CONN_TIMEOUT if received else KEEPALIVE_TIMEOUT)
+                closed = not data
+                received += data
+                continue
+            requests_served += 1
+
+            # parse the request and create the response (reading or writing files) off the event loop
+            response, response_file, keep_alive = await loop.run_in_executor(
+                None, process_request, http_request_msg, server_dir, verbose,
+                requests_served < MAX_KEEPALIVE_REQUESTS
+            )
+
+            # send back response message (the file after the header, without copying it through python if possible)
+            writer.write(response)
+            if response_file:
+                file_path, offset, count = response_file
+                file = await loop.run_in_executor(None, open, file_path, 'rb')
+                try:
+                    await loop.sendfile(writer.transport, file, offset, count)
+                finally:
+                    file.close()
+            await writer.drain()
+            print("* Response sent to {}".format(addr)) if verbose else ''
+            print("* Response: \n\n{}".format(response.decode("utf-8", errors="replace")).strip()) if verbose else ''
+            print("* (body: {2} bytes from {1} of {0})".format(*response_file)) if verbose and response_file else ''
+            print()
+            if not keep_alive:
+                break
+
+    except asyncio.TimeoutError:
+        print("* Client {} idle for too long".format(addr)) if verbose else ''
+    except ConnectionError:
+        print("* Client {} reset the connection".format(addr)) if verbose else ''
+    except Exception as error:
+        # a failing client must not take the event loop down with it
+        print("!!! Error while serving {}: {}".format(addr, error))
+    finally:
+        writer.close()
+        print('* Connection closed') if verbose else ''
+
+
+def serve_connections(connections, slots, idle_connections, server_dir, verbose):
+    # worker: serve the queued connections one after the other, for as long as the server runs
+    while True:
+        conn, addr, state, has_slot = connections.get()
+        conn.settimeout(CONN_TIMEOUT)
+        try:
+            state = handle_client(conn, addr, server_dir, verbose, state)
+        except Exception as error:
+            # a failing client must not take the worker down with it
+            print("!!! Error while serving {}: {}".format(addr, error))
+            conn.close()
+            state = None
+        finally:
+            if has_slot:
+                slots.release()
+        if state is not None:
+            idle_connections.add(conn, addr, state)
+
+
+def reject_client(conn, addr, verbose):
+    # every worker is busy and the queue is full: answer 503 right away rather than letting the client wait
+    print("* Server overloaded, rejected client from {}".format(addr)) if verbose else ''
+    response_body = STATUS_MESSAGE[503]['htmlbody']
+    response = "HTTP/1.0 503 {}\r\nDate: {}\r\n".format(STATUS_MESSAGE[503]['message'], DATE)
+    response += "Content-Type: text/html\r\n"
+    response += "Content-Length: {}\r\n".format(len(response_body))
+    response += "Retry-After: 1\r\n"
+    response += "Connection: close"
+    response += "\r\n\r\n{}".format(response_body)
+    try:
+        conn.setblocking(False)
+        conn.sendall(response.encode("utf-8"))
+        conn.shutdown(socket.SHUT_WR)
+        # drop the request if it is already there: closing with unread data would reset the connection
+        while conn.recv(4096):
+            pass
+    except OSError:
+        pass
+    finally:
+        conn.close()
 
 
 def parse_request(http_request_msg):
@@ -67,7 +365,7 @@ def parse_request(http_request_msg):
     http_request_msg[0] <- [method][server dir][http protocol ver] & [header line]
     http_request_msg[1] <- [body]
     '''
-    http_request_msg = http_request_msg.split('\r\n\r\n')
+    http_request_msg = http_request_msg.split('\r\n\r\n', 1)
     metadata = http_request_msg[0].split('\r\n')
     metadata = list(filter(None, metadata))
 
@@ -85,14 +383,22 @@ def parse_request(http_request_msg):
     return headers, body, request_method, request_path, protocol_ver
 
 
-def create_response_msg(headers, post_body_message, request_method, request_path, protocol_ver, server_dir, verbose):
+def create_response_msg(headers, post_body_message, request_method, request_path, protocol_ver, server_dir, verbose,
+                        keep_alive=False):
     # initialize variables
     response = ''
     response_body = ''
+    response_content = None
+    response_file = None
+    cached = None
     status_code = 200
     content_type = ''
     content_length = 0
-    connection = 'close'
+    content_range = ''
+    accept_ranges = False
+    etag = ''
+    last_modified = ''
+    connection = 'keep-alive' if keep_alive else 'close'
     request_abs_path = server_dir + request_path
 
     ######## INVALID SECURE ACCESS ########
@@ -102,16 +408,53 @@ def create_response_msg(headers, post_body_message, request_method, request_path
         
     ########## GET ##########
     elif request_method == 'GET':
-        # 1. GET / or GET /folder
-        if request_path == '/' or os.path.isdir(request_abs_path):
-            files = os.listdir(request_abs_path)
+        request_path, _, request_query = request_path.partition('?')
+        request_abs_path = server_dir + request_path
+        cached = FILE_CACHE.lookup(request_abs_path)
+        # validators of the folder or file, which the client sends back to revalidate what it has kept
+        if cached and (cached.is_file or (cached.is_dir and cached.listing is not None)):
+            etag, last_modified = cached.etag, cached.last_modified
+        # 0. the client has the current version already (If-None-Match / If-Modified-Since): no body
+        if etag and not_modified(headers, etag, cached.mtime // 1000000000):
+            status_code = 304
+            accept_ranges = cached.is_file
+        # 1. GET / or GET /folder (or a page of it: GET /folder?offset=&limit=)
+        elif cached and cached.is_dir:
+            page = parse_listing_page(request_query)
             content_type = 'text/plain'
-            response_body = '\n'.join(files) if len(files) > 0 else '\n{}\nNo files have found in this directory "{}"'.format(status_code, server_dir)
-        # 2. GET /filename
-        elif os.path.isfile(request_abs_path):
-            with open(request_abs_path, 'r') as file:
-                content_type = 'text/plain' ##########
-                response_body += file.read()
+            if cached.listing is None:
+                status_code = 403
+                response_body = '' if any(DEFAULT_USER_AGENT in header for header in headers) else STATUS_MESSAGE[status_code]['htmlbody']
+            elif page is None:
+                status_code = 400
+                response_body = '' if any(DEFAULT_USER_AGENT in header for header in headers) else STATUS_MESSAGE[status_code]['htmlbody']
+            elif page != (0, None):
+                offset, limit = page
+                response_body = '\n'.join(cached.listing[offset:] if limit is None else cached.listing[offset:offset + limit])
+            elif len(cached.listing) > 0:
+                # the listing rendered once when the folder was cached
+                response_content = cached.content
+            else:
+                response_body = '\n{}\nNo files have found in this directory "{}"'.format(status_code, server_dir)
+        # 2. GET /filename (or the bytes of it in a Range header, unless If-Range tells the client has another version)
+        # (a small file from the cache, otherwise sent as is from disk after the header, not read here)
+        elif cached and cached.is_file:
+            content_type = 'text/plain' ##########
+            accept_ranges = True
+            try:
+                byte_range = parse_range(headers, cached.size) if range_applies(headers, etag, last_modified) else None
+                first, last = byte_range or (0, cached.size - 1)
+                if (first, last) != (0, cached.size - 1):
+                    status_code = 206
+                    content_range = 'bytes {}-{}/{}'.format(first, last, cached.size)
+                if cached.content is not None:
+                    response_content = cached.content[first:last + 1]
+                else:
+                    response_file = (request_abs_path, first, last + 1 - first)
+            except ValueError:
+                status_code = 416
+                content_range = 'bytes */{}'.format(cached.size)
+                response_body = '' if any(DEFAULT_USER_AGENT in header for header in headers) else STATUS_MESSAGE[status_code]['htmlbody']
         # INVALID: PATH DOES NOT EXIST
         else:
             status_code = 404
@@ -134,6 +477,7 @@ def create_response_msg(headers, post_body_message, request_method, request_path
             # if file does not exist, then create, otherwise overwrite to the existing file
             with open(os.path.join(directories, filename), 'w') as file:
                 file.write(post_body_message)
+            FILE_CACHE.invalidate_written(os.path.join(directories, filename), server_dir)
             content_type = 'text/plain' ##########
 
     ######## INVALID REQUEST METHOD ########
@@ -141,57 +485,146 @@ def create_response_msg(headers, post_body_message, request_method, request_path
         status_code = 400
         response_body = '' if any(DEFAULT_USER_AGENT in header for header in headers) else STATUS_MESSAGE[status_code]['htmlbody']
     
-    # set the content length
-    content_length = len(response_body)
+    # set the content length (in bytes)
+    if response_content is None:
+        response_content = response_body.encode("utf-8")
+    content_length = response_file[2] if response_file else len(response_content)
 
     # replace certain header queries if client specified them manually in the header of request method
-    if status_code == 200:
+    # (not Content-Length: it tells how long the body of the response really is)
+    if status_code in (200, 206):
         for header in headers:
-            if 'Content-Length' in header:
-                content_length = header.replace('Content-Length:', '').strip()
             if 'Content-Type' in header:
                 content_type = header.replace('Content-Type:', '').strip()
 
 
     response += "{} {} {}\r\nDate: {}\r\n".format(protocol_ver, status_code, STATUS_MESSAGE[status_code]['message'], DATE)
     response += "Content-Type: {}\r\n".format(content_type) if content_type else ''
-    response += "Content-Length: {}\r\n".format(content_length)
+    response += "Content-Length: {}\r\n".format(content_length) if status_code != 304 else ''
+    response += "ETag: {}\r\nLast-Modified: {}\r\n".format(etag, last_modified) if etag and status_code in (200, 206, 304) else ''
+    response += "Accept-Ranges: bytes\r\n" if accept_ranges else ''
+    response += "Content-Range: {}\r\n".format(content_range) if content_range else ''
     response += "Connection: {}".format(connection)
-    response += "\r\n\r\n{}".format(response_body)
+    response += "\r\nKeep-Alive: timeout={}".format(KEEPALIVE_TIMEOUT) if keep_alive else ''
+    response += "\r\n\r\n"
 
     print('* Response message created') if verbose else ''
-    return response
+    # (bytes) only the header if the body is to be sent from response_file: (path, offset, count)
+    return response.encode("utf-8") + response_content, response_file
 
 
-def handle_client(conn, addr, server_dir, verbose):
-    print('\n\n==============================================')
-    print("* New client from {}".format(addr))
+def parse_listing_page(request_query):
+    # ?offset=&limit= of a folder listing: (offset, limit) with limit None for all the names left,
+    # or None if they are not valid
+    query = parse_qs(request_query)
+    try:
+        offset = int(query['offset'][0]) if 'offset' in query else 0
+        limit = int(query['limit'][0]) if 'limit' in query else None
+    except ValueError:
+        return None
+    if offset < 0 or (limit is not None and limit < 0):
+        return None
+    return offset, limit
+
+
+def handle_client(conn, addr, server_dir, verbose, state=None):
+    # state: (bytes received, requests served) of a keep-alive connection coming back from the idle ones,
+    # returned to put it there between two requests (None once the connection is closed)
+    if state is None:
+        print('\n\n==============================================')
+        print("* New client from {}".format(addr))
+    received, requests_served = state or (bytearray(), 0)
+    # a connection coming back has its next request arriving: it is read before parking it again
+    parked_requests = requests_served
+    closed = False
+    keep_open = False
 
     try:
         while True:
-            http_request_msg = conn.recv(4096).decode()
-            if not http_request_msg:
-                break
-
-            # parse http request
-            headers, body, request_method, request_path, protocol_ver = parse_request(http_request_msg)
-            print('\n\n----------------------------------------------')
-            print("* Request Messages: \n{}".format(http_request_msg.strip())) if verbose else ''
-            print("\n* Request Message Queries: \n\theaders: {} \n\tbody: {} \n\trequest method: {} \n\trequest path: {} \n\tprotocol version: {}\
-                ".format(headers, body, request_method, request_path, protocol_ver)) if verbose else ''
+            # the next request may already be in what was received (pipelined), or still be on its way
+            http_request_msg = next_message(received, closed)
+            if http_request_msg is None:
+                if closed:
+                    break
+                if requests_served > parked_requests and not received:
+                    # between two requests: wait for the next one among the idle connections, not on this worker
+                    keep_open = True
+                    return received, requests_served
+                conn.settimeout(CONN_TIMEOUT if received else KEEPALIVE_TIMEOUT)
+                data = conn.recv(4096)
+                closed = not data
+                received += data
+                continue
+            requests_served += 1
 
-            # create respone message
-            response = create_response_msg(headers, body, request_method, request_path, protocol_ver, server_dir, verbose)
+            response, response_file, keep_alive = process_request(http_request_msg, server_dir, verbose,
+                                                                  requests_served < MAX_KEEPALIVE_REQUESTS)
 
-            # send back response message
-            conn.sendall(response.encode("utf-8"))
+            # send back response message (the file after the header, by sendfile, or by chunks where it is not available)
+            conn.sendall(response)
+            if response_file:
+                file_path, offset, count = response_file
+                with open(file_path, 'rb') as file:
+                    conn.sendfile(file, offset, count)
             print("* Response sent to {}".format(addr)) if verbose else ''
-            print("* Response: \n\n{}".format(response).strip()) if verbose else ''
+            print("* Response: \n\n{}".format(response.decode("utf-8", errors="replace")).strip()) if verbose else ''
+            print("* (body: {2} bytes from {1} of {0})".format(*response_file)) if verbose and response_file else ''
             print()
+            if not keep_alive:
+                break
 
+    except socket.timeout:
+        print("* Client {} idle for too long".format(addr)) if verbose else ''
+    except ConnectionError:
+        print("* Client {} reset the connection".format(addr)) if verbose else ''
     finally:
-        conn.close()
-        print('* Connection closed') if verbose else ''
+        if not keep_open:
+            conn.close()
+            print('* Connection closed') if verbose else ''
+
+
+def process_request(http_request_msg, server_dir, verbose, keep_alive=False):
+    # parse http request (bytes), a request which cannot be decoded or parsed is answered 400 and the connection closed
+    try:
+        http_request_msg = http_request_msg.decode()
+        headers, body, request_method, request_path, protocol_ver = parse_request(http_request_msg)
+    except (UnicodeDecodeError, IndexError) as error:
+        print("!!! Invalid request: {!r}".format(error)) if verbose else ''
+        return create_bad_request(), None, False
+    print('\n\n----------------------------------------------')
+    print("* Request Messages: \n{}".format(http_request_msg.strip())) if verbose else ''
+    print("\n* Request Message Queries: \n\theaders: {} \n\tbody: {} \n\trequest method: {} \n\trequest path: {} \n\tprotocol version: {}\
+        ".format(headers, body, request_method, request_path, protocol_ver)) if verbose else ''
+
+    # the connection stays open for the next request if the client wants it (and may send more)
+    keep_alive = keep_alive and request_keeps_alive(headers, protocol_ver)
+
+    # create respone message
+    response, response_file = create_response_msg(headers, body, request_method, request_path, protocol_ver,
+                                                  server_dir, verbose, keep_alive)
+    return response, response_file, keep_alive
+
+
+def create_bad_request():
+    response_body = STATUS_MESSAGE[400]['htmlbody']
+    response = "HTTP/1.0 400 {}\r\nDate: {}\r\n".format(STATUS_MESSAGE[400]['message'], DATE)
+    response += "Content-Type: text/html\r\n"
+    response += "Content-Length: {}\r\n".format(len(response_body))
+    response += "Connection: close"
+    response += "\r\n\r\n{}".format(response_body)
+    return response.encode("utf-8")
+
+
+def request_keeps_alive(headers, protocol_ver):
+    # persistent by default in HTTP/1.1, on request in HTTP/1.0
+    connection = ''
+    for header in headers:
+        name, _, value = header.partition(':')
+        if name.strip().lower() == 'connection':
+            connection = value.strip().lower()
+    if protocol_ver == 'HTTP/1.1':
+        return connection != 'close'
+    return connection == 'keep-alive'
 
 
 
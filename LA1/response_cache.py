@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+from http_message import RECV_SIZE
+
+# responses kept by httpc, revalidated with the server (conditional GET) instead of being downloaded again
+DEFAULT_CACHE_DIR = './outputs/cache/'
+
+
+class ResponseCache:
+    """
+    ResponseCache keeps on disk the responses to GET requests which have validators (ETag, Last-Modified),
+    so that the next GET of the same URL only asks the server whether the response changed
+    (If-None-Match / If-Modified-Since): a 304 Not Modified has no body, the one kept is used instead.
+
+    A response is kept as two files named after a hash of its URL: its body, and its metadata
+    (URL, status line, validators) as JSON. The body is written aside as it is received and only
+    replaces the one kept once it is complete, so an interrupted download never leaves a truncated entry.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def lookup(self, url):
+        """lookup returns the metadata (dict) of the response kept for url, or None."""
+        try:
+            with open(self.path(url, '.json'), encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url or not os.path.exists(self.path(url, '.body')):
+            return None
+        return meta
+
+    @staticmethod
+    def conditional_headers(meta):
+        """conditional_headers returns the headers (dict) asking the server whether the response kept changed."""
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    @staticmethod
+    def is_cacheable(response):
+        """is_cacheable tells if a response can be kept: a whole body (200) the server can revalidate."""
+        return response.status_code == 200 and ('etag' in response.headers or 'last-modified' in response.headers)
+
+    def body_chunks(self, url):
+        """body_chunks yields the body (bytes) kept for url by chunks."""
+        with open(self.path(url, '.body'), 'rb') as body_file:
+            for chunk in iter(lambda: body_file.read(RECV_SIZE), b''):
+                yield chunk
+
+    def store(self, url, response):
+        """store yields the body of response by chunks (as ResponseReader.body_chunks) while keeping it,
+        the response kept for url is replaced once the whole body was received."""
+        os.makedirs(self.directory, exist_ok=True)
+        # several httpc (or threads) may get the same URL at once: each writes its own file aside
+        temp_path = self.path(url, '.body.{}-{}.tmp'.format(os.getpid(), threading.get_ident()))
+        try:
+            with open(temp_path, 'wb') as body_file:
+                for chunk in response.body_chunks():
+                    body_file.write(chunk)
+                    yield chunk
+            if not response.complete:
+                # the end of the body was the end of the connection: it may have been cut short
+                return
+            meta = {
+                'url': url,
+                'status_line': response.status_line,
+                'etag': response.headers.get('etag', ''),
+                'last_modified': response.headers.get('last-modified', ''),
+                'content_type': response.headers.get('content-type', ''),
+            }
+            # the entry kept is dropped first and the metadata written last, so that the validators
+            # of the previous response never go with the new body
+            self.remove(url)
+            os.replace(temp_path, self.path(url, '.body'))
+            with open(temp_path, 'w', encoding='utf-8') as meta_file:
+                json.dump(meta, meta_file)
+            os.replace(temp_path, self.path(url, '.json'))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def remove(self, url):
+        """remove drops the response kept for url (if any)."""
+        for suffix in ('.json', '.body'):
+            try:
+                os.remove(self.path(url, suffix))
+            except FileNotFoundError:
+                pass
+
+    def path(self, url, suffix):
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + suffix)
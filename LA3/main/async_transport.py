@@ -0,0 +1,355 @@
+import asyncio
+import ipaddress
+import socket
+from packet import Packet
+from selective_repeat import ReliableConnection
+from utils.http_message import next_message
+from utils.global_config import (
+    CONN_TIMEOUT,
+    CONN_IDLE_TIMEOUT,
+    DEFAULT_ROUTER_HOST,
+    DEFAULT_ROUTER_PORT,
+    DEFAULT_SERVER_HOST,
+    DEFAULT_SERVER_PORT,
+    DEFAULT_WINDOW_SIZE,
+    MAX_PAYLOAD_SIZE,
+    MAX_SEQ_NUM,
+    ConnectionState,
+    PacketType
+)
+
+'''
+asyncio implementation of the LA3 reliable transport.
+
+The connection state machine (ReliableConnection: handshake, selective repeat, FIN teardown)
+is the same as in libhttpc/libhttpfs, but it is driven by datagram_received callbacks and
+loop.call_later timers instead of blocking socket loops,
+so one event loop can handle many flows at once.
+'''
+
+
+class ReliableStream:
+    """
+    ReliableStream drives a ReliableConnection on an event loop.
+
+    on_data is called with the stream whenever DATA or FIN of the peer arrived,
+    the bytes received in order are in connection.received_data.
+    """
+
+    def __init__(self, loop, transport, router_addr, connection, on_data):
+        self.loop = loop
+        self.transport = transport
+        self.router_addr = router_addr
+        self.connection = connection
+        self.on_data = on_data
+
+        # resolved once the handshake is done
+        self.established = loop.create_future()
+        # resolved once both FINs are exchanged and acknowledged
+        self.closed = loop.create_future()
+        # timer (asyncio.TimerHandle) of the earliest packet in flight or of the delayed ACK
+        self.timer = None
+        self.last_active = loop.time()
+        # dropped (expired, or a response failed): nothing is sent or received on it anymore
+        self.aborted = False
+
+    def connect(self):
+        """connect starts the handshake and returns a future resolved once it is done."""
+        self.connection.connect()
+        self.transmit()
+        return self.established
+
+    def send(self, chunks):
+        """send queues a message (a stream of byte chunks), it goes out once the handshake is done."""
+        self.connection.send(chunks)
+        self.transmit()
+
+    def close(self):
+        """close sends a FIN after the queued messages and returns a future resolved once the connection is closed."""
+        self.connection.close()
+        self.transmit()
+        return self.closed
+
+    def transmit(self):
+        # resend the expired packets and send the ones entering the window
+        if self.aborted:
+            return
+        now = self.loop.time()
+        sender = self.connection.sender
+        packets = sender.expired(now)
+        try:
+            # the file of a response is read as its packets enter the window
+            packets.extend(sender.fill_window(now))
+            closed = self.connection.is_closed()
+        except OSError as error:
+            print(f"!!! Connection aborted: {error}")
+            self.abort()
+            return
+        ack_packet = self.connection.ack_due(now)
+        if ack_packet:
+            packets.append(ack_packet)
+        for packet in packets:
+            self.send_packet(packet)
+
+        if self.connection.state == ConnectionState.ESTABLISHED and not self.established.done():
+            self.established.set_result(None)
+        if closed:
+            self.cancel_timer()
+            if not self.closed.done():
+                self.closed.set_result(None)
+        else:
+            self.schedule_timer(now)
+
+    def schedule_timer(self, now):
+        # a single loop timer is enough: it fires at the earliest deadline of the window (or delayed ACK)
+        self.cancel_timer()
+        timeouts = [timeout for timeout in (self.connection.sender.time_to_next_timeout(now),
+                                            self.connection.time_to_ack(now))
+                    if timeout is not None]
+        if timeouts:
+            self.timer = self.loop.call_later(min(timeouts), self.transmit)
+
+    def cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def packet_received(self, packet):
+        if self.aborted:
+            return
+        self.last_active = self.loop.time()
+        ack_packet = self.connection.packet_received(packet, self.last_active)
+        if ack_packet:
+            self.send_packet(ack_packet)
+        if packet.packet_type in (PacketType.DATA, PacketType.FIN):
+            self.on_data(self)
+        # an ACK may have freed frames of the window, or the handshake let queued messages go
+        self.transmit()
+
+    def send_packet(self, packet):
+        self.transport.sendto(packet.to_bytes(), self.router_addr)
+
+    def abort(self):
+        self.aborted = True
+        self.cancel_timer()
+        for future in (self.established, self.closed):
+            if not future.done():
+                future.cancel()
+
+
+class HttpcProtocol(asyncio.DatagramProtocol):
+    """
+    HttpcProtocol is the client end of one connection: it sends a request and waits for the response.
+    """
+
+    def __init__(self, loop, router_addr, peer_ip_addr, peer_port,
+                 window_size=DEFAULT_WINDOW_SIZE, payload_size=MAX_PAYLOAD_SIZE, delayed_ack=False):
+        self.loop = loop
+        self.router_addr = router_addr
+        self.peer_ip_addr = peer_ip_addr
+        self.peer_port = peer_port
+        self.window_size = window_size
+        self.payload_size = payload_size
+        self.delayed_ack = delayed_ack
+        self.stream = None
+        self.response = loop.create_future()
+
+    def connection_made(self, transport):
+        self.stream = ReliableStream(self.loop, transport, self.router_addr,
+                                     ReliableConnection(self.peer_ip_addr, self.peer_port,
+                                                        self.window_size, self.payload_size,
+                                                        delayed_ack=self.delayed_ack),
+                                     self.data_received)
+
+    def datagram_received(self, data, addr):
+        try:
+            packet = Packet.from_bytes(data)
+        except ValueError:
+            return
+        self.stream.packet_received(packet)
+
+    def data_received(self, stream):
+        # the response is complete with its Content-Length bytes of body (or when the server closed)
+        connection = stream.connection
+        response = next_message(connection.received_data, connection.peer_closed)
+        if response is None and not connection.peer_closed:
+            return
+        if not self.response.done():
+            self.response.set_result(response or b'')
+
+    def error_received(self, exc):
+        if not self.response.done():
+            self.response.set_exception(exc)
+
+
+class HttpfsProtocol(asyncio.DatagramProtocol):
+    """
+    HttpfsProtocol is the server end: one ReliableStream per client connection,
+    keyed by the client's (peer_ip, peer_port), opened by its SYN, with idle expiry.
+
+    Requests are parsed and performed by an HttpfsRequests instance.
+    """
+
+    def __init__(self, loop, server):
+        self.loop = loop
+        self.server = server
+        self.transport = None
+        # connection table: (peer_ip, peer_port) -> ReliableStream
+        self.streams = {}
+        self.expiry_timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.expiry_timer = self.loop.call_later(CONN_IDLE_TIMEOUT, self.expire_streams)
+
+    def connection_lost(self, exc):
+        if self.expiry_timer:
+            self.expiry_timer.cancel()
+        for stream in self.streams.values():
+            stream.abort()
+        self.streams.clear()
+
+    def datagram_received(self, data, addr):
+        try:
+            packet = Packet.from_bytes(data)
+        except ValueError:
+            return
+
+        key = (packet.peer_ip, packet.peer_port)
+        stream = self.streams.get(key)
+        if packet.packet_type == PacketType.SYN and \
+                (stream is None or stream.connection.peer_isn != packet.seq_num):
+            connection = ReliableConnection(packet.peer_ip, packet.peer_port,
+                                            self.server.window_size, self.server.payload_size,
+                                            self.server.congestion_control, self.server.delayed_ack)
+            try:
+                connection.accept(packet)
+            except ValueError:
+                return
+            if stream:
+                stream.abort()
+            stream = ReliableStream(self.loop, self.transport, addr, connection, self.request_received)
+            self.streams[key] = stream
+        elif stream is None:
+            # FIN resent by a client whose connection is already closed here: ACK it again
+            if packet.packet_type == PacketType.FIN:
+                self.transport.sendto(
+                    ReliableConnection(packet.peer_ip, packet.peer_port).create_ack(
+                        (packet.seq_num + 1) % MAX_SEQ_NUM
+                    ).to_bytes(),
+                    addr
+                )
+            return
+
+        # responses go back through the router the request came from
+        stream.router_addr = addr
+        stream.packet_received(packet)
+        if stream.aborted or stream.connection.is_closed():
+            del self.streams[key]
+
+    def request_received(self, stream):
+        # perform every complete request exactly once and in order,
+        # then close after the last one once the client sent FIN
+        connection = stream.connection
+        while True:
+            request = next_message(connection.received_data, connection.peer_closed)
+            if request is None:
+                break
+            try:
+                request_message_queries = self.server.parse_request(request.decode("utf-8"))
+            except (UnicodeDecodeError, IndexError):
+                # answered on its own stream only, the other ones keep being served
+                connection.send(self.server.create_bad_request())
+                continue
+            connection.send(self.server.create_response(request_message_queries))
+        if connection.peer_closed:
+            connection.close()
+
+    def expire_streams(self):
+        now = self.loop.time()
+        for key, stream in list(self.streams.items()):
+            if now - stream.last_active > CONN_IDLE_TIMEOUT:
+                stream.abort()
+                del self.streams[key]
+        self.expiry_timer = self.loop.call_later(CONN_IDLE_TIMEOUT, self.expire_streams)
+
+
+async def send_request(request_payload,
+                       router_host=DEFAULT_ROUTER_HOST,
+                       router_port=DEFAULT_ROUTER_PORT,
+                       server_host=DEFAULT_SERVER_HOST,
+                       server_port=DEFAULT_SERVER_PORT,
+                       timeout=CONN_IDLE_TIMEOUT,
+                       window_size=DEFAULT_WINDOW_SIZE,
+                       payload_size=MAX_PAYLOAD_SIZE,
+                       delayed_ack=False):
+    """send_request sends an HTTP request message to the server via the router.
+
+        Each call uses its own socket (and so its own connection on the server),
+        so many of them can run concurrently on the same event loop.
+
+        Args:
+            request_payload: the whole HTTP request message (str).
+            timeout: seconds to wait for the complete response.
+            window_size, payload_size: proposed at the handshake.
+            delayed_ack: ACK every other in-order packet of the response.
+
+        Returns:
+            the whole HTTP response message (bytes).
+
+        Raises:
+            asyncio.TimeoutError: if the response did not arrive within timeout.
+    """
+    loop = asyncio.get_running_loop()
+    router_addr = (socket.gethostbyname(router_host), router_port)
+    # peer address = receiver's address (server) for sending packet
+    peer_ip_addr = ipaddress.ip_address(socket.gethostbyname(server_host))
+
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: HttpcProtocol(loop, router_addr, peer_ip_addr, server_port,
+                              window_size, payload_size, delayed_ack),
+        local_addr=('0.0.0.0', 0)
+    )
+    stream = protocol.stream
+    try:
+        # the request is queued during the handshake and goes out right after it
+        stream.connect()
+        stream.send([request_payload.encode("utf-8")])
+        response = await asyncio.wait_for(protocol.response, timeout)
+        try:
+            await asyncio.wait_for(stream.close(), timeout)
+            # stay a couple of RTOs to ACK the server's FIN again if our ACK got lost
+            await asyncio.sleep(min(2 * stream.connection.sender.rtt.rto, CONN_TIMEOUT))
+        except asyncio.TimeoutError:
+            # the response is complete anyway, the server drops the connection once idle
+            pass
+        return response
+    finally:
+        stream.abort()
+        transport.close()
+
+
+async def serve(server):
+    """serve runs the file server of an HttpfsRequests instance on the running event loop until cancelled."""
+    loop = asyncio.get_running_loop()
+    server.assign_server_dir()
+
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: HttpfsProtocol(loop, server),
+        local_addr=('0.0.0.0', server.server_port)
+    )
+    print(f"\n\n* * * * * * Server is listening at {server.server_port} * * * * * *")
+    try:
+        await loop.create_future()
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    # 20 concurrent GET requests from one event loop (router and httpfs must be running)
+    async def main():
+        payload = f"GET / HTTP/1.0\r\nHost:{DEFAULT_SERVER_HOST}\r\n\r\n"
+        responses = await asyncio.gather(*[send_request(payload) for _ in range(20)])
+        print(f">>> {len(responses)} responses received, first one: \n{responses[0].decode('utf-8')}")
+
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+import csv
+from utils.global_config import (
+    INITIAL_CWND,
+    INITIAL_SSTHRESH,
+    DEFAULT_CONGESTION_CONTROL
+)
+
+
+class CongestionController:
+    """
+    CongestionController decides how many packets a sender may have in flight (cwnd, in packets).
+
+    It starts in slow start (cwnd + 1 per ACK, so doubling every RTT) up to ssthresh,
+    then grows by congestion avoidance, which subclasses define.
+    A loss halves cwnd (reverted if it turns out the packet was only reordered)
+    and a retransmission timeout brings it back to one packet.
+    With tracing, every change of cwnd is kept in trace, to be exported for analysis
+    (one entry per ACK: it is only kept if it will be exported).
+    """
+
+    name = None
+
+    def __init__(self, initial_cwnd=INITIAL_CWND, ssthresh=INITIAL_SSTHRESH, tracing=False):
+        self.cwnd = initial_cwnd
+        self.ssthresh = ssthresh
+        self.started_at = None
+        # cwnd and ssthresh before the last loss, in case it turns out to be a false one
+        self.undo_state = None
+        # (seconds since the first event, cwnd, ssthresh, event)
+        self.tracing = tracing
+        self.trace = []
+
+    def window(self):
+        """window returns the number of packets that may be in flight."""
+        return max(int(self.cwnd), 1)
+
+    def on_ack(self, now, rtt, max_cwnd):
+        """on_ack grows cwnd for a new ACK.
+
+            Args:
+                now: time of the ACK.
+                rtt: RTT sample of the ACKed packet, None if it was retransmitted (Karn's rule).
+                max_cwnd: window of the receiver, cwnd never grows past it.
+        """
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+            event = 'slow start'
+        else:
+            self.congestion_avoidance(rtt)
+            event = 'avoidance'
+        self.cwnd = min(self.cwnd, max_cwnd)
+        self.record(now, event)
+
+    def congestion_avoidance(self, rtt):
+        raise NotImplementedError
+
+    def on_loss(self, now):
+        # multiplicative decrease, then back to congestion avoidance
+        self.undo_state = (self.cwnd, self.ssthresh)
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = self.ssthresh
+        self.record(now, 'loss')
+
+    def on_timeout(self, now):
+        # nothing gets through anymore: start over with slow start
+        self.undo_state = None
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = 1
+        self.record(now, 'timeout')
+
+    def undo(self, now):
+        """undo reverts the last loss decrease, the packet was only reordered."""
+        if self.undo_state is None:
+            return
+        cwnd, ssthresh = self.undo_state
+        self.undo_state = None
+        self.cwnd = max(self.cwnd, cwnd)
+        self.ssthresh = max(self.ssthresh, ssthresh)
+        self.record(now, 'undo')
+
+    def record(self, now, event):
+        if not self.tracing:
+            return
+        if self.started_at is None:
+            self.started_at = now
+        self.trace.append((now - self.started_at, self.cwnd, self.ssthresh, event))
+
+    def export_trace(self, file_path):
+        """export_trace writes the cwnd trace to a csv file (time, cwnd, ssthresh, event)."""
+        with open(file_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['time', 'cwnd', 'ssthresh', 'event'])
+            for time, cwnd, ssthresh, event in self.trace:
+                writer.writerow([f"{time:.6f}", f"{cwnd:.3f}", f"{ssthresh:.3f}", event])
+
+
+class RenoController(CongestionController):
+    """
+    RenoController is the loss-based AIMD of TCP Reno: + 1 packet per RTT in congestion avoidance.
+    """
+
+    name = 'reno'
+
+    def congestion_avoidance(self, rtt):
+        self.cwnd += 1 / self.cwnd
+
+
+class DelayController(CongestionController):
+    """
+    DelayController is a delay-based variant (TCP Vegas).
+
+    The packets queued in the network are estimated from how much the RTT exceeds
+    the smallest one seen: cwnd * (1 - base RTT / RTT). Slow start ends as soon
+    as they exceed GAMMA, congestion avoidance keeps them between ALPHA and BETA,
+    so cwnd stops growing before the router queues overflow and drop packets.
+    """
+
+    name = 'delay'
+
+    ALPHA = 1
+    BETA = 3
+    GAMMA = 1
+
+    def __init__(self, initial_cwnd=INITIAL_CWND, ssthresh=INITIAL_SSTHRESH, tracing=False):
+        super().__init__(initial_cwnd, ssthresh, tracing)
+        self.base_rtt = None
+        self.last_rtt = None
+
+    def queued(self):
+        if not self.last_rtt:
+            return 0
+        return self.cwnd * (1 - self.base_rtt / self.last_rtt)
+
+    def on_ack(self, now, rtt, max_cwnd):
+        if rtt is not None:
+            self.base_rtt = rtt if self.base_rtt is None else min(self.base_rtt, rtt)
+            self.last_rtt = rtt
+        if self.cwnd < self.ssthresh and self.queued() > self.GAMMA:
+            # the queues are filling up: leave slow start
+            self.ssthresh = self.cwnd
+        super().on_ack(now, rtt, max_cwnd)
+
+    def congestion_avoidance(self, rtt):
+        queued = self.queued()
+        if queued < self.ALPHA:
+            self.cwnd += 1 / self.cwnd
+        elif queued > self.BETA:
+            self.cwnd = max(self.cwnd - 1 / self.cwnd, 2)
+
+
+# congestion controllers by the name given to -cc/--congestion-control
+CONGESTION_CONTROLLERS = {
+    RenoController.name: RenoController,
+    DelayController.name: DelayController,
+}
+
+
+def create_controller(name=DEFAULT_CONGESTION_CONTROL, tracing=False):
+    """create_controller returns a new congestion controller of the given kind, keeping its cwnd trace with tracing.
+
+        Raises:
+            ValueError: if there is no congestion controller of that name.
+    """
+    if name not in CONGESTION_CONTROLLERS:
+        raise ValueError("unknown congestion control: {}".format(name))
+    return CONGESTION_CONTROLLERS[name](tracing=tracing)
@@ -0,0 +1,69 @@
+import socket
+from packet import MAX_LEN, MIN_LEN, Packet
+from utils.global_config import MAX_BATCH_SIZE
+
+# scatter/gather sending is not available on every platform (e.g. Windows)
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+
+class DatagramIO:
+    """
+    DatagramIO batches the datagram I/O of a UDP socket.
+
+    Every wakeup drains all the datagrams already queued on the socket into
+    a preallocated buffer pool, and a batch of packets (e.g. a full window)
+    goes out in one burst, each with its header and payload gathered by sendmsg.
+    """
+
+    def __init__(self, sock, batch_size=MAX_BATCH_SIZE):
+        self.socket = sock
+        # receive buffer pool, reused on every receive_batch call
+        self.buffers = [memoryview(bytearray(MAX_LEN)) for _ in range(batch_size)]
+        # send buffer for the header (sendmsg) or the whole packet (sendto fallback)
+        self.send_buffer = memoryview(bytearray(MAX_LEN))
+
+    def receive_batch(self, timeout):
+        """receive_batch waits up to timeout for a datagram, then drains every one already queued.
+
+            Returns:
+                a list of (packet, sender address). Packet payloads are views into the
+                buffer pool: they are only valid until the next call and must be copied to be kept.
+        """
+        received = []
+        self.socket.settimeout(timeout)
+        try:
+            nbytes, sender_addr = self.socket.recvfrom_into(self.buffers[0])
+        except socket.timeout:
+            return received
+        self.add_packet(received, self.buffers[0][:nbytes], sender_addr)
+
+        # drain the rest without blocking
+        self.socket.setblocking(False)
+        for buffer in self.buffers[1:]:
+            try:
+                nbytes, sender_addr = self.socket.recvfrom_into(buffer)
+            except BlockingIOError:
+                break
+            self.add_packet(received, buffer[:nbytes], sender_addr)
+        return received
+
+    def add_packet(self, received, raw, sender_addr):
+        # Convert from network-byte (big-endian order) to host-byte, dropping malformed datagrams
+        try:
+            received.append((Packet.from_bytes(raw), sender_addr))
+        except ValueError as err:
+            print(f"!!! Dropped an invalid packet from {sender_addr}: {err}")
+
+    def send(self, packet, addr):
+        if HAS_SENDMSG:
+            # gather header and payload without copying the payload
+            packet.pack_header_into(self.send_buffer)
+            self.socket.sendmsg([self.send_buffer[:MIN_LEN], packet.payload], (), 0, addr)
+        else:
+            packet_size = packet.pack_into(self.send_buffer)
+            self.socket.sendto(self.send_buffer[:packet_size], addr)
+
+    def send_batch(self, packets, addr):
+        """send_batch sends the packets back to back to the same address."""
+        for packet in packets:
+            self.send(packet, addr)
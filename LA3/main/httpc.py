@@ -1,14 +1,19 @@
 import argparse
 from argparse import RawTextHelpFormatter as rtf
 import sys
+from congestion import CONGESTION_CONTROLLERS
 from libhttpc import HttpcRequests
+from selective_repeat import check_sizes
 from utils.global_config import (
     RequestMethod,
     INPUTS_DIR,
     DEFAULT_ROUTER_HOST,
     DEFAULT_ROUTER_PORT,
     DEFAULT_SERVER_HOST,
-    DEFAULT_SERVER_PORT
+    DEFAULT_SERVER_PORT,
+    DEFAULT_CONGESTION_CONTROL,
+    DEFAULT_WINDOW_SIZE,
+    MAX_PAYLOAD_SIZE
 )
 from utils.console_messages import HttpcManuals
 
@@ -33,6 +38,12 @@ class HTTPC:
         self.router_port = DEFAULT_ROUTER_PORT
         self.server_host = DEFAULT_SERVER_HOST
         self.server_port = DEFAULT_SERVER_PORT
+        # transport config
+        self.congestion_control = DEFAULT_CONGESTION_CONTROL
+        self.cwnd_trace = ''
+        self.window_size = DEFAULT_WINDOW_SIZE
+        self.payload_size = MAX_PAYLOAD_SIZE
+        self.delayed_ack = False
 
         parser = argparse.ArgumentParser(
             prog='httpc',
@@ -108,8 +119,59 @@ class HTTPC:
             dest='server_port',
             help=HttpcManuals.SP_HELP
         )
+        parser.add_argument(
+            '-cc',
+            '--congestion-control',
+            choices=sorted(CONGESTION_CONTROLLERS),
+            default=DEFAULT_CONGESTION_CONTROL,
+            dest='congestion_control',
+            help=HttpcManuals.CC_HELP
+        )
+        parser.add_argument(
+            '--cwnd-trace',
+            metavar='FILENAME',
+            dest='cwnd_trace',
+            help=HttpcManuals.CWND_TRACE_HELP
+        )
+        parser.add_argument(
+            '-w',
+            '--window-size',
+            type=int,
+            default=DEFAULT_WINDOW_SIZE,
+            dest='window_size',
+            help=HttpcManuals.W_HELP
+        )
+        parser.add_argument(
+            '-ps',
+            '--payload-size',
+            type=int,
+            default=MAX_PAYLOAD_SIZE,
+            dest='payload_size',
+            help=HttpcManuals.PS_HELP
+        )
+        parser.add_argument(
+            '--delayed-ack',
+            action='store_true',
+            dest='delayed_ack',
+            help=HttpcManuals.DA_HELP
+        )
         return parser
 
+    def transport_args(self, parser, args):
+        try:
+            check_sizes(args.window_size, args.payload_size)
+        except ValueError as error:
+            parser.error(str(error))
+        self.window_size = args.window_size
+        self.payload_size = args.payload_size
+        self.router_host = args.router_host
+        self.router_port = args.router_port
+        self.server_host = args.server_host
+        self.server_port = args.server_port
+        self.congestion_control = args.congestion_control
+        self.cwnd_trace = args.cwnd_trace
+        self.delayed_ack = args.delayed_ack
+
     def get(self):
         parser = argparse.ArgumentParser(
             prog='httpc',
@@ -128,10 +190,7 @@ class HTTPC:
         self.headers = args.headers
         self.verbose = args.verbose
         self.output_file = args.output
-        self.router_host = args.router_host
-        self.router_port = args.router_port
-        self.server_host = args.server_host
-        self.server_port = args.server_port
+        self.transport_args(parser, args)
 
         self.make_request(args)
 
@@ -169,10 +228,7 @@ class HTTPC:
         self.inline_data = args.inline_data
         self.file = args.file
         self.output_file = args.output
-        self.router_host = args.router_host
-        self.router_port = args.router_port
-        self.server_host = args.server_host
-        self.server_port = args.server_port
+        self.transport_args(parser, args)
 
         self.make_request(args)
 
@@ -224,7 +280,12 @@ class HTTPC:
             router_host=self.router_host,
             router_port=self.router_port,
             server_host=self.server_host,
-            server_port=self.server_port
+            server_port=self.server_port,
+            congestion_control=self.congestion_control,
+            cwnd_trace=self.cwnd_trace,
+            window_size=self.window_size,
+            payload_size=self.payload_size,
+            delayed_ack=self.delayed_ack
         )
         # Open sender socket
         request.open_socket()
@@ -240,6 +301,8 @@ class HTTPC:
         )
         # Run client (send request)
         request.send_request()
+        # Close the connection (FIN teardown)
+        request.close()
 
     def convert_headers_to_dict(self):
         self.headers = [header.split(':') for header in self.headers]
@@ -1,8 +1,15 @@
 import argparse
 from argparse import RawTextHelpFormatter as rtf
+from congestion import CONGESTION_CONTROLLERS
 from libhttpfs import HttpfsRequests
+from selective_repeat import check_sizes
 from utils.console_messages import HttpfsManuals
-from utils.global_config import DEFAULT_SERVER_PORT
+from utils.global_config import (
+    DEFAULT_SERVER_PORT,
+    DEFAULT_CONGESTION_CONTROL,
+    DEFAULT_WINDOW_SIZE,
+    MAX_PAYLOAD_SIZE
+)
 
 
 class HTTPFS:
@@ -10,6 +17,11 @@ class HTTPFS:
         self.verbose = False
         self.port = DEFAULT_SERVER_PORT
         self.directory = ''
+        self.congestion_control = DEFAULT_CONGESTION_CONTROL
+        self.cwnd_trace = False
+        self.window_size = DEFAULT_WINDOW_SIZE
+        self.payload_size = MAX_PAYLOAD_SIZE
+        self.delayed_ack = False
 
         parser = argparse.ArgumentParser(
             prog='httpfs',
@@ -37,13 +49,60 @@ class HTTPFS:
             type=str,
             help=HttpfsManuals.D_HELP
         )
+        parser.add_argument(
+            '-cc',
+            '--congestion-control',
+            choices=sorted(CONGESTION_CONTROLLERS),
+            default=self.congestion_control,
+            dest='congestion_control',
+            help=HttpfsManuals.CC_HELP
+        )
+        parser.add_argument(
+            '--cwnd-trace',
+            action='store_true',
+            dest='cwnd_trace',
+            help=HttpfsManuals.CWND_TRACE_HELP
+        )
+        parser.add_argument(
+            '-w',
+            '--window-size',
+            type=int,
+            default=self.window_size,
+            dest='window_size',
+            help=HttpfsManuals.W_HELP
+        )
+        parser.add_argument(
+            '-ps',
+            '--payload-size',
+            type=int,
+            default=self.payload_size,
+            dest='payload_size',
+            help=HttpfsManuals.PS_HELP
+        )
+        parser.add_argument(
+            '--delayed-ack',
+            action='store_true',
+            dest='delayed_ack',
+            help=HttpfsManuals.DA_HELP
+        )
         args = parser.parse_args()
+        try:
+            check_sizes(args.window_size, args.payload_size)
+        except ValueError as error:
+            parser.error(str(error))
 
         self.verbose = args.verbose
         self.port = args.port
         self.directory = args.directory
+        self.congestion_control = args.congestion_control
+        self.cwnd_trace = args.cwnd_trace
+        self.window_size = args.window_size
+        self.payload_size = args.payload_size
+        self.delayed_ack = args.delayed_ack
         
-        server = HttpfsRequests(self.port, self.directory, self.verbose)
+        server = HttpfsRequests(self.port, self.directory, self.verbose,
+                                self.congestion_control, self.cwnd_trace,
+                                self.window_size, self.payload_size, self.delayed_ack)
         server.run_server()
 
 
@@ -1,11 +1,18 @@
 import json
 import socket
+import time
 import ipaddress
 from urllib.parse import urlparse
-from packet import Packet
+from datagram_io import DatagramIO
+from packet import MIN_LEN
+from selective_repeat import ReliableConnection, sacked_seq_nums
+from utils.http_message import message_bounds, next_message
 from utils.shell_output import shell_boxing
 from utils.global_config import (
     CONN_TIMEOUT,
+    CONN_IDLE_TIMEOUT,
+    MIN_RTO,
+    ACK_DELAY,
     INPUTS_DIR,
     OUTPUTS_DIR,
     DEFAULT_USER_AGENT,
@@ -13,12 +20,13 @@ from utils.global_config import (
     DEFAULT_ROUTER_PORT,
     DEFAULT_SERVER_HOST,
     DEFAULT_SERVER_PORT,
+    DEFAULT_CONGESTION_CONTROL,
+    DEFAULT_WINDOW_SIZE,
+    MAX_PAYLOAD_SIZE,
     RequestMethod,
+    ConnectionState,
     PacketType,
-    PacketStatus,
-    MAX_PAYLOAD_SIZE,
-    MAX_SEQ_NUM,
-    MAX_WINDOW_SIZE
+    PacketStatus
 )
 
 # 3. HTTP client receives response message containing html file, displays html.
@@ -39,17 +47,32 @@ class HttpcRequests:
                  router_host=DEFAULT_ROUTER_HOST,
                  router_port=DEFAULT_ROUTER_PORT,
                  server_host=DEFAULT_SERVER_HOST,
-                 server_port=DEFAULT_SERVER_PORT
+                 server_port=DEFAULT_SERVER_PORT,
+                 # congestion controller, and file its cwnd trace is exported to (in OUTPUTS_DIR)
+                 congestion_control=DEFAULT_CONGESTION_CONTROL,
+                 cwnd_trace='',
+                 # window size and max payload size proposed at the handshake
+                 window_size=DEFAULT_WINDOW_SIZE,
+                 payload_size=MAX_PAYLOAD_SIZE,
+                 # ACK every other in-order packet of the responses
+                 delayed_ack=False
                  ):
         # router and server host/port config
         self.router_host = router_host
         self.router_port = router_port
+        # resolved once, not on every datagram sent
+        self.router_addr = (socket.gethostbyname(router_host), router_port)
         self.server_host = server_host
         self.server_port = server_port
         # peer address = receiver's address (server) for sending packet
         self.peer_ip_addr = ipaddress.ip_address(
             socket.gethostbyname(self.server_host)
         )
+        self.congestion_control = congestion_control
+        self.cwnd_trace = cwnd_trace
+        self.window_size = window_size
+        self.payload_size = payload_size
+        self.delayed_ack = delayed_ack
         # additional attributes
         self.packet_status = None
         self.request_method = None
@@ -57,6 +80,8 @@ class HttpcRequests:
         self.output_file = None
         self.hostName = None
         self.send_payload = None
+        # reliable connection to the server, set up by the first request
+        self.connection = None
 
         self.buffer_is_full = False
 
@@ -65,6 +90,8 @@ class HttpcRequests:
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # try to receive a response within timeout
         self.client_socket.settimeout(CONN_TIMEOUT)
+        # batched send/receive through preallocated buffers
+        self.datagram_io = DatagramIO(self.client_socket)
 
         if self.verbose:
             print(">>> Client socket set up completed.")
@@ -91,23 +118,27 @@ class HttpcRequests:
 
         # Request-URI = [ url_path ][ "?" url_query ]
         request_uri = f"{url_path}?{url_query}" if url_query else url_path
-        # Request-Heaer = Headers CRLF User-Agent CRLF
-        request_header = self.create_request_header(request_header)
 
         # if get method, then send only header message
         if self.request_method == RequestMethod.GET:
+            # Request-Heaer = Headers CRLF User-Agent CRLF
+            request_header = self.create_request_header(request_header)
             # Request-Line = Method Request-URI HTTP-Version CRLF
             request_line = f"GET {request_uri} HTTP/1.0\r\n"
             self.send_payload = f"{request_line}{request_header}\r\n"
 
         # if post method, then send both header and body
         if self.request_method == RequestMethod.POST:
-            # Request-Line = Method Request-URI HTTP-Version CRLF
-            request_line = f"POST {request_uri} HTTP/1.0\r\n"
             # Request-Body
+            request_header = dict(request_header) if request_header else dict()
             request_body = self.create_request_body(
                 request_header, post_inline_data, post_input_file
             )  # in json
+            # the server finds the end of the body (and the start of the next request) with it
+            request_header['Content-Length'] = len(request_body.encode("utf-8"))
+            request_header = self.create_request_header(request_header)
+            # Request-Line = Method Request-URI HTTP-Version CRLF
+            request_line = f"POST {request_uri} HTTP/1.0\r\n"
             self.send_payload = f"{request_line}{request_header}\r\n{request_body}\r\n"
 
         if self.verbose:
@@ -115,149 +146,177 @@ class HttpcRequests:
 
     # run client
 
-    def send_request(self):
-        #TODO: Three-way-handshake
-        '''three_way_handshake(peer_ip, server_port, router_addr, router_port, conn)'''
-        handshake = True
-
-        # construct packet
+    def connect(self):
+        # three-way handshake: SYN -> SYNACK -> ACK (sent along with the next batch of packets),
+        # negotiating the initial sequence numbers, the window size and the max payload size
         if self.verbose:
-            print(">>> Constructing packet(s) to send")
-        send_packets = self.generate_packets()
-        self.packet_status = PacketStatus.CREATED
+            print(">>> Connecting to server (three-way handshake)")
+        self.connection = ReliableConnection(self.peer_ip_addr, self.server_port,
+                                             self.window_size, self.payload_size,
+                                             self.congestion_control, self.delayed_ack, bool(self.cwnd_trace))
+        self.connection.connect()
+        if not self.run_transport(lambda: self.connection.state == ConnectionState.ESTABLISHED):
+            self.connection = None
+            return False
+
         if self.verbose:
-            print(">>> Packet(s) created.")
+            print(f">>> Connection established (window size={self.connection.window_size}, " +
+                  f"max payload size={self.connection.payload_size}).")
             print()
+        return True
 
-        # send packets tp router via selective repeat protocol
-        seq_start = 0  # sequence number of first frame in window
-        num_buffer_acked = 0
-        window_buffers = []  # array of max window size
-        num_frame_available = MAX_WINDOW_SIZE
-        
-        if self.verbose:
-            print(">>> Send data packet(s) to server via router")
-            print(f">>> There are total of {len(send_packets)} packets to be sent")
+    def send_request(self):
+        # the handshake is done by the first request only,
+        # the following ones reuse the connection until close()
+        if self.connection is None and not self.connect():
+            return
 
-        while True:
-            # if no more packets left then stop sending
-            if not send_packets:
-                break
-            
-            window_buffers.extend(send_packets[:num_frame_available])
-            send_packets = send_packets[num_frame_available:]
-            num_frame_available = 0
-
-            for packet in window_buffers[num_buffer_acked:]:
-                try:
-                    if packet.packet_type == PacketType.DATA:
-
-                        # output packet to be sent
-                        self.output_packet(packet)
-
-                        # convert from host-byte to network-byte(big-endian order) before sending packet
-                        byte_packet = packet.to_bytes()
-
-                        # send packet to router
-                        self.client_socket.sendto(
-                            byte_packet, (self.router_host, self.router_port)
-                        )
-                        print(">>> Successfully sent.")
-
-                        print("\n.....waiting for a response.....\n")
-
-                        # receive response packet from router
-                        receive_byte_packet, sender_addr = self.client_socket.recvfrom(
-                            1024)
-                        self.packet_status = PacketStatus.RECEIVED
-                        print(
-                            ">>> Successfully received a response from server via router.")
-
-                        # Convert from network-byte(big-endian order) to host-byte after receiving packet
-                        receive_packet = Packet.from_bytes(receive_byte_packet)
-
-                        packet_type = receive_packet.packet_type
-                        seq_num = receive_packet.seq_num
-
-                        if packet_type == PacketType.ACK and seq_num == seq_start:
-                            print(">>> ACK Received, window moved.")
-                            # output packet received
-                            self.output_packet(receive_packet, sender_addr)
-
-                            num_buffer_acked += 1
-                            num_frame_available += 1
-                            if seq_num == MAX_SEQ_NUM:
-                                seq_start = 0
-                            else:
-                                seq_start = seq_num + 1
-
-                        elif packet_type == PacketType.ACK and seq_num != seq_start:
-                            print(">>> ACK Received, yet previous packet(s) have pending ACKs.")
-                            window_buffers[seq_num] = receive_packet
-
-                    elif packet.packet_type == PacketType.ACK:
-                        print(">>> This is an already ACKed packet. window moved.")
-                        packet_type = packet.packet_type
-                        seq_num = packet.seq_num
-
-                        if seq_num == seq_start:
-                            # output packet received
-                            self.output_packet(packet, sender_addr)
-
-                            num_buffer_acked += 1
-                            num_frame_available += 1
-                            if seq_num == MAX_SEQ_NUM:
-                                seq_start = 0
-                            else:
-                                seq_start = seq_num + 1
-
-                except socket.timeout:
-                    print(f">>> No response after {CONN_TIMEOUT}s")
-                    print()
-
-        # close the connection
+        # the request is split into packets lazily as the window slides
+        if self.verbose:
+            print(">>> Send request packet(s) to server via router")
+        self.connection.send([self.send_payload.encode("utf-8")])
+
+        # the response is complete once its header and Content-Length bytes of body are in
+        # (or once the server closed the connection), anything after it belongs to the next response
+        response_data = self.connection.received_data
+        if not self.run_transport(
+                lambda: message_bounds(response_data) is not None or self.connection.peer_closed):
+            return
+        response = next_message(response_data, self.connection.peer_closed) or b''
+
+        self.output_response(response, self.router_addr)
+
+    def close(self):
+        # FIN teardown: our FIN goes behind what is left to send, then the server sends its own
+        if self.connection is not None:
+            self.connection.close()
+            if self.run_transport(self.connection.is_closed):
+                self.linger()
+            if self.verbose:
+                print(">>> Connection closed.")
+            if self.cwnd_trace:
+                self.export_cwnd_trace()
+            self.connection = None
         self.client_socket.close()
 
-    def generate_packets(self):
-        sequence_num = 0
-        send_packets = []
-        payload = self.send_payload
-        i = 0
+    def run_transport(self, is_done):
+        # drive the connection via selective repeat protocol until is_done():
+        # keep a full window of packets in flight and slide it as soon as its base is ACKed
+        sender = self.connection.sender
+        last_received = time.monotonic()
+
+        while not is_done():
+            # send every packet that just entered the window without waiting for ACKs,
+            # and resend only the packets whose own retransmission timer expired, in one burst
+            now = time.monotonic()
+            send_packets = sender.fill_window(now)
+            for packet in sender.expired(now):
+                print(f">>> Timer of packet #{packet.seq_num} expired, resending it " +
+                      f"(RTO is now {sender.rtt.rto * 1000:.0f}ms, " +
+                      f"cwnd is {sender.congestion.cwnd:.1f}).")
+                send_packets.append(packet)
+            self.send_packets(send_packets)
+            # no other packet came in time to share the delayed ACK: it goes out on its own
+            ack_packet = self.connection.ack_due(now)
+            if ack_packet:
+                self.datagram_io.send_batch([ack_packet], self.router_addr)
+
+            # wait for a packet no longer than the earliest retransmission timer
+            # (or the delayed ACK), then take every packet that is already there
+            now = time.monotonic()
+            timeout = sender.time_to_next_timeout(now)
+            ack_timeout = self.connection.time_to_ack(now)
+            timeouts = ([max(timeout, MIN_RTO)] if timeout is not None else []) + \
+                ([max(ack_timeout, ACK_DELAY)] if ack_timeout is not None else [])
+            received = self.datagram_io.receive_batch(min(timeouts) if timeouts else CONN_TIMEOUT)
+            if not received:
+                if time.monotonic() - last_received > CONN_IDLE_TIMEOUT:
+                    print(f"!!! No response from server after {CONN_IDLE_TIMEOUT}s. Aborting.")
+                    return False
+                if not timeouts:
+                    print(f">>> No response after {CONN_TIMEOUT}s, still waiting.")
+                continue
+            last_received = time.monotonic()
+
+            self.packet_status = PacketStatus.RECEIVED
+            ack_packets = []
+            for receive_packet, sender_addr in received:
+                if receive_packet.packet_type == PacketType.ACK:
+                    self.output_ack(receive_packet)
+                else:
+                    self.output_packet(receive_packet, sender_addr)
+                ack_packet = self.connection.packet_received(receive_packet, last_received)
+                if ack_packet:
+                    ack_packets.append(ack_packet)
+            ack_packet = self.connection.ack_due(last_received)
+            if ack_packet:
+                ack_packets.append(ack_packet)
+
+            self.datagram_io.send_batch(ack_packets, self.router_addr)
+        return True
+
+    def linger(self):
+        # stay a couple of RTOs after the teardown: if the ACK of the server's FIN got lost,
+        # the server resends its FIN and it has to be ACKed again
+        deadline = time.monotonic() + min(2 * self.connection.sender.rtt.rto, CONN_TIMEOUT)
         while True:
-            # if no more payload then stop creating packets
-            if not payload:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 break
-            sequence_num = i % MAX_SEQ_NUM
-            packet = Packet(
-                packet_type=PacketType.DATA,
-                seq_num=sequence_num,
-                peer_ip_addr=self.peer_ip_addr,
-                peer_port=self.server_port,
-                # convert request message payload to byte code
-                payload=payload[:MAX_PAYLOAD_SIZE].encode("utf-8")
-            )
-
-            # append to list of packets
-            send_packets.append(packet)
-
-            # if payload has more than maximum payload size, loop again to make another packet
-            payload = payload[MAX_PAYLOAD_SIZE:]
-
-            i += 1
+            ack_packets = []
+            for receive_packet, _ in self.datagram_io.receive_batch(remaining):
+                ack_packet = self.connection.packet_received(receive_packet, time.monotonic())
+                if ack_packet:
+                    ack_packets.append(ack_packet)
+            self.datagram_io.send_batch(ack_packets, self.router_addr)
+
+    def export_cwnd_trace(self):
+        trace_file = OUTPUTS_DIR + self.cwnd_trace
+        try:
+            self.connection.sender.congestion.export_trace(trace_file)
+            print(f">>> Congestion window trace recorded in {trace_file}")
+        except OSError:
+            print("!!! Could not output the congestion window trace to file.")
 
-        return send_packets
+    def send_packets(self, packets):
+        # output packets to be sent
+        self.packet_status = PacketStatus.CREATED
+        for packet in packets:
+            self.output_packet(packet)
+
+        # convert from host-byte to network-byte(big-endian order) and send packets to router
+        self.datagram_io.send_batch(packets, self.router_addr)
+        self.packet_status = PacketStatus.SENT
+        if self.verbose and packets:
+            print(f">>> Packet(s) {', '.join(f'#{packet.seq_num}' for packet in packets)} " +
+                  "successfully sent.")
+
+    def output_ack(self, packet):
+        # cumulative ACK, along with the packets received out of order (SACK)
+        sender = self.connection.sender
+        acked_frames = sender.acked_frames(packet.seq_num, packet.payload)
+        sacked = ', '.join(f'#{seq_num}' for seq_num in sacked_seq_nums(packet.seq_num, packet.payload))
+        ack = f"ACK up to #{packet.seq_num}" + (f" (SACK {sacked})" if sacked else '')
+        if not acked_frames:
+            print(f">>> {ack} is a duplicate, already acknowledged.")
+        elif acked_frames[0] is next(iter(sender.window.values())):
+            print(f">>> {ack} received, window moved.")
+        else:
+            print(f">>> {ack} received, yet previous packet(s) have pending ACKs.")
 
     def output_packet(self, packet, sender_addr=''):
-        # Extracts/decode response message payload
-        payload = packet.payload.decode("utf-8")
+        # Extracts/decode packet payload
+        payload = bytes(packet.payload).decode("utf-8", errors="replace")
+
+        header_size = MIN_LEN
+        body_size = len(packet.payload)
+        packet_total_size = header_size + body_size
 
-        byte_packet = packet.to_bytes()
-        packet_total_size = len(byte_packet)
-        header_size = len(byte_packet)-len(payload)
-        body_size = len(payload)
+        if not self.verbose:
+            return
 
         # console output for sending packet data
-        if self.packet_status == PacketStatus.CREATED and self.verbose:
+        if self.packet_status == PacketStatus.CREATED:
             print(f"Packet: {packet}")
             print(f"Packet total size: {packet_total_size}" +
                   f"(header size={header_size}, body size={body_size})"
@@ -266,42 +325,45 @@ class HttpcRequests:
 
         # console output for response packet data
         elif self.packet_status == PacketStatus.RECEIVED:
-            # Divide response message into header (if verbose) and body
-            payload_header = payload[:payload.find('\r\n\r\n')]
-            payload_body = payload[payload.find('\r\n\r\n'):]
-
-            # Output response
-            output_str = ''
-            output_str += f"Router: {sender_addr}\n" + \
-                f"Packet: {packet}\n" + \
-                f"Packet total size: {packet_total_size}\n" + \
-                f"(header size={header_size}, body size={body_size})\n" \
-                if self.verbose else ''
-
-            if self.request_method == RequestMethod.GET:
-                output_str += "Payload: \n"
-                if self.output_file:
-                    output_str += f"{shell_boxing(payload_header) if self.verbose else ''}" + \
-                        f"\nThe response message payload received was recorded in {self.output_file}"
-                else:
-                    output_str += f"{shell_boxing(payload_header+payload_body)}" if self.verbose \
-                        else f"{shell_boxing(payload_body) if payload_body.strip() else ''}"
+            print(f"Router: {sender_addr}\n" +
+                  f"Packet: {packet}\n" +
+                  f"Packet total size: {packet_total_size}\n" +
+                  f"(header size={header_size}, body size={body_size})")
+
+    def output_response(self, response, sender_addr=''):
+        # Divide response message (bytes) into header (if verbose) and body,
+        # the body is only decoded to be printed: the file requested may be binary
+        header_end = response.find(b'\r\n\r\n')
+        response_header = response[:header_end].decode("utf-8", errors="replace")
+        response_body = response[header_end:].decode("utf-8", errors="replace")
 
-            if self.request_method == RequestMethod.POST:
-                output_str += ">>> Post request message/payload was successfully stored."
+        # Output response
+        output_str = f"Router: {sender_addr}\n" if self.verbose else ''
+
+        if self.request_method == RequestMethod.GET:
+            output_str += "Payload: \n"
+            if self.output_file:
+                self.output_to_file(response[header_end + 4:])
+                output_str += f"{shell_boxing(response_header) if self.verbose else ''}" + \
+                    f"\nThe response message payload received was recorded in {self.output_file}"
+            else:
+                output_str += f"{shell_boxing(response_header+response_body)}" if self.verbose \
+                    else f"{shell_boxing(response_body) if response_body.strip() else ''}"
+
+        if self.request_method == RequestMethod.POST:
+            output_str += f"{shell_boxing(response_header)}\n" if self.verbose else ''
+            output_str += ">>> Post request message/payload was successfully stored."
 
-            print(output_str)
+        print(output_str)
 
     def output_to_file(self, body):
         self.output_file = OUTPUTS_DIR + self.output_file
         try:
-            file = open(self.output_file, "w", encoding='utf-8')
-            file.write(body)
+            with open(self.output_file, "wb") as file:
+                file.write(body)
         except OSError:
             print("!!! Could not output the response to file.")
-            print(shell_boxing(body))
-        finally:
-            file.close()
+            print(shell_boxing(body.decode("utf-8", errors="replace")))
 
     def create_request_header(self, request_header):
         # add host entry to the headers dict
@@ -431,4 +493,5 @@ if __name__ == "__main__":
         verbose=True
     )
     request.send_request()
+    request.close()
     print()
@@ -1,51 +1,96 @@
+import itertools
 import socket
 import os
+import time
+from datagram_io import DatagramIO
 from packet import Packet
+from selective_repeat import ReliableConnection, sacked_seq_nums
+from utils.http_message import next_message, parse_range
 from utils.shell_output import shell_boxing
 from utils.global_config import (
     GLOBAL_SERVER_DIR,
+    OUTPUTS_DIR,
     DEFAULT_SERVER_PORT,
+    DEFAULT_CONGESTION_CONTROL,
+    DEFAULT_WINDOW_SIZE,
+    MAX_PAYLOAD_SIZE,
     DATE,
     DEFAULT_USER_AGENT,
     STATUS_MESSAGE,
+    CONN_IDLE_TIMEOUT,
+    FILE_CHUNK_SIZE,
+    MIN_RTO,
+    ACK_DELAY,
     MAX_SEQ_NUM,
-    MAX_WINDOW_SIZE,
     PacketType
 )
 
 
+class Connection(ReliableConnection):
+    """
+    Connection holds the state of one client flow through the router.
+
+    Flows are keyed by the client's (peer_ip, peer_port) carried in every packet,
+    so each client gets its own receive window and reassembly buffer for its requests,
+    and its own sender for the responses. A flow starts with the client's SYN
+    and carries requests one after the other until both FINs are exchanged.
+    """
+
+    def __init__(self, peer_ip_addr, peer_port, window_size=DEFAULT_WINDOW_SIZE,
+                 payload_size=MAX_PAYLOAD_SIZE, congestion_control=DEFAULT_CONGESTION_CONTROL,
+                 delayed_ack=False, cwnd_trace=False):
+        super().__init__(peer_ip_addr, peer_port, window_size, payload_size, congestion_control, delayed_ack,
+                         cwnd_trace)
+        # router the client's packets come through (where the responses go back)
+        self.router_addr = None
+        self.request_message_queries = ''
+        self.last_active = time.monotonic()
+
+    @property
+    def key(self):
+        return (self.peer_ip_addr.packed, self.peer_port)
+
+    def is_idle(self, now):
+        return now - self.last_active > CONN_IDLE_TIMEOUT
+
+
 class HttpfsRequests:
     def __init__(self,
                  server_port=DEFAULT_SERVER_PORT,
                  server_dir='',
                  verbose=False,
+                 congestion_control=DEFAULT_CONGESTION_CONTROL,
+                 cwnd_trace=False,
+                 window_size=DEFAULT_WINDOW_SIZE,
+                 payload_size=MAX_PAYLOAD_SIZE,
+                 delayed_ack=False,
                  ):
         self.server_port = server_port
         self.server_dir = server_dir
         self.verbose = verbose
-
-        self.peer_ip_addr = ''
-        self.request_message_queries = ''
+        # congestion controller of the responses,
+        # and whether the cwnd trace of every connection is exported (in OUTPUTS_DIR)
+        self.congestion_control = congestion_control
+        self.cwnd_trace = cwnd_trace
+        # largest window size and max payload size accepted at the handshake
+        self.window_size = window_size
+        self.payload_size = payload_size
+        # ACK every other in-order packet of the requests
+        self.delayed_ack = delayed_ack
+
+        # connection table: (peer_ip, peer_port) -> Connection
+        self.connections = {}
+        self.last_expiry_check = time.monotonic()
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # batched send/receive through preallocated buffers
+        self.datagram_io = DatagramIO(self.server_socket)
+        # ACKs to send at the end of the current batch (router address -> ACK packets)
+        self.pending_acks = {}
 
     def run_server(self):
 
         try:
-            # Create or Assign Server Directory
-            # if custom directory chosen then create new directory inside the global server folder
-            if self.server_dir:
-                self.server_dir = self.server_dir.replace('/', '')
-                self.server_dir = GLOBAL_SERVER_DIR + '/' + self.server_dir
-                # if custom directory does not exist
-                if not os.path.exists(self.server_dir):
-                    os.mkdir(self.server_dir)
-                    print(f">>> New server folder {self.server_dir} created.")
-                print(f">>> Server folder {self.server_dir} was assigned.")
-            # if default directory chosen then 'server/default' server folder will be chosen.
-            else:
-                self.server_dir = GLOBAL_SERVER_DIR + '/default'
-                print(
-                    f">>> Default server folder: {self.server_dir} was assigned.")
+            self.assign_server_dir()
 
             # start the server socket
             self.server_socket.bind(('', self.server_port))
@@ -53,80 +98,36 @@ class HttpfsRequests:
                 f"\n\n* * * * * * Server is listening at {self.server_port} * * * * * *")
 
             # receive packets from router via selective repeat protocol
-            seq_start = 0  # sequence number of first frame in window
-            window_buffers = []  # array of max window size
-            seq_nums_window = []
-            received_buffer = []
-
             while True:
-                # Server receives packet with the carrier address (router address)
-                packet, sender_addr = self.server_socket.recvfrom(1024)
-
-                # Convert from network-byte (big-endian order) to host-byte when receiving packet
-                packet = Packet.from_bytes(packet)
-
-                # packet from different peer addr -> initialize
-                if self.peer_ip_addr != packet.peer_ip_addr \
-                        or self.request_message_queries['request_method'] == "GET" \
-                        or self.request_message_queries['request_method'] == "POST":
-                    self.peer_ip_addr = packet.peer_ip_addr
-                    self.request_message_queries = ''
-                    # initialize every attrs
-                    window_buffers = []
-                    seq_nums_window = []
-                    received_buffer = []
-                    seq_start = 0
-                
-                # parse and retrieve http request data
-                self.request_message_queries = self.parse_request(packet)
-
-                # update available sequence numbers in window
-                for i in range(MAX_WINDOW_SIZE):
-                    if i + seq_start <= MAX_SEQ_NUM:
-                        if i + seq_start not in seq_nums_window:
-                            seq_nums_window.append(i + seq_start)
-                    else:
-                        if i + seq_start - MAX_SEQ_NUM not in seq_nums_window:
-                            seq_nums_window.append(i + seq_start - MAX_SEQ_NUM)
-
-                packet_type = packet.packet_type
-                seq_num = packet.seq_num
-
-                if packet_type == PacketType.DATA and seq_num == seq_start:
-                    # return ACK with message
-                    print(f">>> Packet #{seq_num} received, send ACK back.")
-
-                    if seq_num == MAX_SEQ_NUM:
-                        seq_start = 0
-                    else:
-                        seq_start = seq_num + 1
-                    seq_nums_window.pop(0)
-
-                    # check all the received buffer as well and move sequence start position all at once
-                    received_buffer_copy = received_buffer
-                    for received_seq in received_buffer_copy:
-                        if seq_start == received_seq:
-                            received_buffer.remove(received_seq)
-
-                            if received_seq == MAX_SEQ_NUM:
-                                seq_start = 0
-                            else:
-                                seq_start = received_seq + 1
-                            seq_nums_window.pop(0)
-
-                elif packet_type == PacketType.DATA and seq_num in seq_nums_window:
-                    # return ACK with message
-                    print(f">>> Packet #{seq_num} received, send ACK back.")
-                    received_buffer.append(seq_num)
-
-                else:
-                    print()
-                    print(f">>> This packet with sequence number #{seq_num} is already received, " +
-                          "thus no request operation performed.")
-                    print()
-
-                # Extracts message's payload
-                self.handle_client(packet, sender_addr, PacketType.ACK)
+                # wake up for the earliest response retransmission timer,
+                # or regularly without traffic to drop idle connections,
+                # then take every packet that is already there
+                received = self.datagram_io.receive_batch(self.next_timeout())
+                if not received:
+                    self.transmit_all()
+                    self.expire_connections()
+                    continue
+
+                # Server receives packets with the carrier address (router address)
+                active_connections = set()
+                for packet, sender_addr in received:
+                    try:
+                        connection = self.handle_packet(packet, sender_addr)
+                    except OSError as error:
+                        self.abort_connection((packet.peer_ip, packet.peer_port), error)
+                        continue
+                    if connection:
+                        active_connections.add(connection)
+
+                # ACKs and response windows of the whole batch go out in bursts,
+                # along with the retransmissions and delayed ACKs due on the connections without traffic
+                # (their timers would otherwise wait for the other clients to go quiet)
+                self.flush_acks()
+                now = time.monotonic()
+                for connection in list(self.connections.values()):
+                    if connection in active_connections or self.timer_expired(connection, now):
+                        self.transmit(connection)
+                self.expire_connections()
 
         except KeyboardInterrupt:
             print("* * * * * * Session Finished with ctrl-C * * * * * *")
@@ -134,96 +135,287 @@ class HttpfsRequests:
         finally:
             self.server_socket.close()
 
-    def handle_client(self, packet, sender_addr, packet_type):
+    def assign_server_dir(self):
+        # Create or Assign Server Directory
+        # if custom directory chosen then create new directory inside the global server folder
+        if self.server_dir:
+            self.server_dir = self.server_dir.replace('/', '')
+            self.server_dir = GLOBAL_SERVER_DIR + '/' + self.server_dir
+            # if custom directory does not exist
+            if not os.path.exists(self.server_dir):
+                os.mkdir(self.server_dir)
+                print(f">>> New server folder {self.server_dir} created.")
+            print(f">>> Server folder {self.server_dir} was assigned.")
+        # if default directory chosen then 'server/default' server folder will be chosen.
+        else:
+            self.server_dir = GLOBAL_SERVER_DIR + '/default'
+            print(
+                f">>> Default server folder: {self.server_dir} was assigned.")
+
+    def handle_packet(self, packet, sender_addr):
+        # every client flow has its own window and reassembly buffer
+        connection = self.get_connection(packet, sender_addr)
+        if connection is None:
+            return None
+
+        packet_type = packet.packet_type
+        seq_num = packet.seq_num
+
+        if packet_type == PacketType.ACK and self.verbose:
+            sacked = ', '.join(f'#{seq_num}' for seq_num in sacked_seq_nums(seq_num, packet.payload))
+            print(f">>> ACK up to #{seq_num} received" + (f" (SACK {sacked})." if sacked else "."))
+
+        ack_packet = connection.packet_received(packet, time.monotonic())
+        if ack_packet:
+            if packet_type in (PacketType.DATA, PacketType.FIN):
+                print(f">>> Packet #{seq_num} received, send ACK back.")
+            self.pending_acks.setdefault(sender_addr, []).append(ack_packet)
+
+        # every request is performed exactly once, as soon as it is complete (Content-Length or FIN),
+        # in order, and its response queued behind the ones of the previous requests
+        while True:
+            request_message = next_message(connection.received_data, connection.peer_closed)
+            if request_message is None:
+                break
+            try:
+                connection.request_message_queries = self.parse_request(request_message.decode("utf-8"))
+            except (UnicodeDecodeError, IndexError) as error:
+                # answered on its own connection only, the other flows keep being served
+                print(f"!!! Invalid request from {connection.peer_ip_addr}:{connection.peer_port}: {error!r}")
+                connection.send(self.create_bad_request())
+                continue
+            self.handle_client(connection, sender_addr)
+
+        # the client has nothing more to send: close our side after the last response
+        if connection.peer_closed and not connection.fin_sent:
+            connection.close()
+            if self.verbose:
+                print(f">>> Client {connection.peer_ip_addr}:{connection.peer_port} sent FIN, " +
+                      "closing the connection.")
+
+        return connection
+
+    def get_connection(self, packet, sender_addr):
+        # look up the client flow, a new one is opened by the SYN of an unknown peer
+        # (or by a SYN with another initial sequence number, the client started over)
+        key = (packet.peer_ip, packet.peer_port)
+        connection = self.connections.get(key)
+
+        if packet.packet_type == PacketType.SYN and \
+                (connection is None or connection.peer_isn != packet.seq_num):
+            connection = Connection(packet.peer_ip_addr, packet.peer_port,
+                                    self.window_size, self.payload_size, self.congestion_control,
+                                    self.delayed_ack, self.cwnd_trace)
+            try:
+                connection.accept(packet)
+            except ValueError as error:
+                print(f"!!! Invalid SYN from {packet.peer_ip_addr}:{packet.peer_port}: {error}")
+                return None
+            self.connections[key] = connection
+            if self.verbose:
+                print(f">>> New connection from {packet.peer_ip_addr}:{packet.peer_port} " +
+                      f"({len(self.connections)} open, window size={connection.window_size}, " +
+                      f"max payload size={connection.payload_size})")
+
+        elif connection is None:
+            # FIN resent by a client whose connection is already closed on this side:
+            # ACK it again so that it can close too
+            if packet.packet_type == PacketType.FIN:
+                self.send_ack(packet, sender_addr)
+            return None
+
+        connection.router_addr = sender_addr
+        connection.last_active = time.monotonic()
+        return connection
+
+    def expire_connections(self):
+        # drop the connections which have been idle for too long (checked at most once in a while)
+        now = time.monotonic()
+        if now - self.last_expiry_check < CONN_IDLE_TIMEOUT:
+            return
+        self.last_expiry_check = now
+        for key, connection in list(self.connections.items()):
+            if connection.is_idle(now):
+                del self.connections[key]
+                self.export_cwnd_trace(connection)
+                if self.verbose:
+                    print(f">>> Connection {key[0]}:{key[1]} expired after " +
+                          f"{CONN_IDLE_TIMEOUT}s idle.")
+
+    def next_timeout(self):
+        # time until the earliest retransmission timer among all the responses in flight,
+        # or until the earliest delayed ACK
+        now = time.monotonic()
+        timeouts = []
+        for connection in self.connections.values():
+            timeout = connection.sender.time_to_next_timeout(now)
+            if timeout is not None:
+                timeouts.append(max(timeout, MIN_RTO))
+            ack_timeout = connection.time_to_ack(now)
+            if ack_timeout is not None:
+                timeouts.append(max(ack_timeout, ACK_DELAY))
+        return min(timeouts) if timeouts else CONN_IDLE_TIMEOUT
+
+    @staticmethod
+    def timer_expired(connection, now):
+        # a response packet to resend, or a delayed ACK to send
+        return connection.sender.time_to_next_timeout(now) == 0 or connection.time_to_ack(now) == 0
+
+    def transmit_all(self):
+        for connection in list(self.connections.values()):
+            self.transmit(connection)
+
+    def transmit(self, connection):
+        # send the packets entering the window (SYNACK, responses, FIN), and resend the expired ones
+        sender = connection.sender
+        now = time.monotonic()
+        send_packets = sender.expired(now)
+        if self.verbose:
+            for packet in send_packets:
+                print(f">>> Timer of response packet #{packet.seq_num} expired, resending it " +
+                      f"(cwnd is {sender.congestion.cwnd:.1f}).")
+        try:
+            # the file of a response is read as its packets enter the window
+            send_packets.extend(sender.fill_window(now))
+            closed = connection.is_closed()
+        except OSError as error:
+            self.abort_connection(connection.key, error)
+            return
+        # no other request packet came in time to share the delayed ACK: it goes out on its own
+        ack_packet = connection.ack_due(now)
+        if ack_packet:
+            send_packets.append(ack_packet)
+        self.datagram_io.send_batch(send_packets, connection.router_addr)
+
+        # both FINs exchanged and acknowledged: the flow is over
+        if closed and self.connections.get(connection.key) is connection:
+            del self.connections[connection.key]
+            self.export_cwnd_trace(connection)
+            if self.verbose:
+                print(f">>> Connection {connection.peer_ip_addr}:{connection.peer_port} closed " +
+                      f"({len(self.connections)} open).")
+
+    def abort_connection(self, key, error):
+        # a response failed (e.g. its file could not be read anymore): only its connection is dropped,
+        # the client gives up once it stops hearing from the server
+        connection = self.connections.pop(key, None)
+        if connection is None:
+            return
+        print(f"!!! Connection {connection.peer_ip_addr}:{connection.peer_port} aborted: {error}")
+        self.export_cwnd_trace(connection)
+
+    def export_cwnd_trace(self, connection):
+        # one csv file per client flow
+        if not self.cwnd_trace:
+            return
+        trace_file = OUTPUTS_DIR + f"cwnd_{connection.peer_ip_addr}_{connection.peer_port}.csv"
+        try:
+            connection.sender.congestion.export_trace(trace_file)
+            print(f">>> Congestion window trace recorded in {trace_file}")
+        except OSError:
+            print("!!! Could not output the congestion window trace to file.")
+
+    def send_ack(self, packet, sender_addr):
+        # cumulative ACK of everything up to the packet, to the peer it came from,
+        # it is sent along with the other ACKs of the batch
+        ack_packet = Packet(packet_type=PacketType.ACK,
+                            seq_num=(packet.seq_num + 1) % MAX_SEQ_NUM,
+                            peer_ip_addr=packet.peer_ip,
+                            peer_port=packet.peer_port,
+                            payload=b'')
+        self.pending_acks.setdefault(sender_addr, []).append(ack_packet)
+
+    def flush_acks(self):
+        for router_addr, ack_packets in self.pending_acks.items():
+            self.datagram_io.send_batch(ack_packets, router_addr)
+        self.pending_acks.clear()
+
+    def handle_client(self, connection, sender_addr):
+        request_message_queries = connection.request_message_queries
         print('\n\n================================================')
-        print(">>> Received a packet from client via router.")
+        print(">>> Received a request from client via router.")
 
         # try:
-        # Output client packet message
+        # Output client request message
         print("Router: ", sender_addr)
-        print("Packet: ", packet)
+        print(f"Client: {connection.peer_ip_addr}:{connection.peer_port}")
         print(
-            f"Payload: \n{shell_boxing(self.request_message_queries['request_message'])}")
+            f"Payload: \n{shell_boxing(request_message_queries['request_message'])}")
         if self.verbose:
             print("Payload Queries: \n{}"
                   .format(
                       shell_boxing(
-                          f"headers: {self.request_message_queries['headers']}\r\n" +
-                          f"body: {self.request_message_queries['body']}\r\n" +
-                          f"request method: {self.request_message_queries['request_method']}\r\n" +
-                          f"request path: {self.request_message_queries['request_path']}\r\n" +
-                          f"protocol version: {self.request_message_queries['protocol_ver']}",
+                          f"headers: {request_message_queries['headers']}\r\n" +
+                          f"body: {request_message_queries['body']}\r\n" +
+                          f"request method: {request_message_queries['request_method']}\r\n" +
+                          f"request path: {request_message_queries['request_path']}\r\n" +
+                          f"protocol version: {request_message_queries['protocol_ver']}",
                           output_queries=True
                       )
                   )
                   )
 
-        # create respone message
-        if self.verbose:
-            print(">>> Performing request and Creating response message")
-        response_msg = self.perform_request(self.request_message_queries)
+        response_chunks = self.create_response(request_message_queries)
 
-        # # create response packet via storing the response message to packet
+        # split the response into DATA packets, generated lazily while the window slides
         if self.verbose:
-            print(">>> Creating response packet")
-        packet.payload = response_msg.encode("utf-8")
-        packet.packet_type = packet_type
-        if self.verbose:
-            print('>>> Response packet created.')
+            print(">>> Creating response packets")
+        connection.send(response_chunks)
+
+        # send back the response to client via router
+        print(">>> Send response packets back to client via router")
 
-        # output response packet message
-        print("Packet: ", packet)
-        print(f"Payload: \n{shell_boxing(response_msg)}")
+    def create_response(self, request_message_queries):
+        # create respone message
+        if self.verbose:
+            print(">>> Performing request and Creating response message")
+        response_msg, response_file = self.perform_request(request_message_queries)
 
-        # convert from host-byte (big-endian order) to network-byte when sending packet
-        packet = packet.to_bytes()
+        # output response message
+        print(f"Response: \n{shell_boxing(response_msg)}")
+        if response_file:
+            print(f">>> Response body ({response_file[2]} bytes from {response_file[1]}) is streamed from {response_file[0].name}")
 
-        # send back the response to client via router
-        print(">>> Send response packet back to client via router")
-        self.server_socket.sendto(packet, sender_addr)
-        print(">>> Successfully sent.")
+        # the response as a stream of byte chunks, the file (if any) being read lazily
+        return itertools.chain(
+            [response_msg.encode("utf-8")], self.read_file(*response_file) if response_file else []
+        )
 
-    def parse_request(self, packet):
+    def parse_request(self, request_message):
         '''
         http_request_msg[0] <- [method][server dir][http protocol ver] & [header line]
         http_request_msg[1] <- [body]
         '''
-        # Extracts response message payload
-        payload = packet.payload.decode("utf-8")
-        headers = ''
-
-        if not self.request_message_queries:
-            http_request_msg = payload.split('\r\n\r\n')
-            metadata = http_request_msg[0].split('\r\n')
-            metadata = list(filter(None, metadata))
-
-            request_lines = metadata[0].split(' ')
-            request_method = request_lines[0]
-            request_path = request_lines[1]
-            protocol_ver = request_lines[2] if len(request_lines) > 2 else ''
-
-            headers = metadata[1:]
-            if len(http_request_msg) == 1:
-                body = ''
-            else:
-                body = http_request_msg[1]
-
-            self.request_message_queries = {
-                'request_message': payload,
-                'headers': headers,
-                'body': body,
-                'request_method': request_method,
-                'request_path': request_path,
-                'protocol_ver': protocol_ver
-            }
-
+        http_request_msg = request_message.split('\r\n\r\n', 1)
+        metadata = http_request_msg[0].split('\r\n')
+        metadata = list(filter(None, metadata))
+
+        request_lines = metadata[0].split(' ')
+        request_method = request_lines[0]
+        request_path = request_lines[1] if len(request_lines) > 1 else ''
+        protocol_ver = request_lines[2] if len(request_lines) > 2 else ''
+
+        headers = metadata[1:]
+        if len(http_request_msg) == 1:
+            body = ''
         else:
-            body = payload
-
-        request_message_queries = self.request_message_queries
-        request_message_queries['body'] = body
-
-        return request_message_queries
+            body = http_request_msg[1]
+
+        return {
+            'request_message': request_message,
+            'headers': headers,
+            'body': body,
+            'request_method': request_method,
+            'request_path': request_path,
+            'protocol_ver': protocol_ver
+        }
+
+    def create_bad_request(self):
+        # 400 response to a request which could not be decoded or parsed
+        response_body = STATUS_MESSAGE[400]['htmlbody']
+        return [self.create_response_message(
+            'HTTP/1.0', 400, 'keep-alive', len(response_body.encode("utf-8")), response_body=response_body
+        ).encode("utf-8")]
 
     def perform_request(self, request_message_queries):
         request_path = request_message_queries['request_path']
@@ -231,10 +423,13 @@ class HttpfsRequests:
 
         # initialize variables
         response_body = ''
+        response_file = None
         status_code = 200
         content_type = ''
         content_length = 0
-        connection = 'close'
+        content_range = ''
+        accept_ranges = False
+        connection = 'keep-alive'
         request_abs_path = self.server_dir + request_path
 
         ### INVALID SECURE ACCESS ###
@@ -252,11 +447,36 @@ class HttpfsRequests:
                 content_type = 'text/plain'
                 response_body = '\n'.join(files) if len(files) > 0 \
                     else f"\n{status_code}\nNo files have found in this directory '{self.server_dir}'"
-            # 2. GET /filename
+            # 2. GET /filename (or the bytes of it in a Range header)
+            # (the file is streamed from disk while sending, not read here: from the descriptor opened now,
+            # whose size is the one announced, even if the path is rewritten or removed meanwhile)
             elif os.path.isfile(request_abs_path):
-                with open(request_abs_path, 'r', encoding='utf-8') as file:
+                try:
+                    file = open(request_abs_path, 'rb')
+                except OSError:
+                    file = None
+                if file is None:
+                    status_code = 403
+                    response_body = '' if any(
+                        DEFAULT_USER_AGENT in header for header in headers) \
+                        else STATUS_MESSAGE[status_code]['htmlbody']
+                else:
                     content_type = 'text/plain'
-                    response_body += file.read()
+                    accept_ranges = True
+                    file_size = os.fstat(file.fileno()).st_size
+                    try:
+                        first, last = parse_range(headers, file_size) or (0, file_size - 1)
+                        if (first, last) != (0, file_size - 1):
+                            status_code = 206
+                            content_range = f"bytes {first}-{last}/{file_size}"
+                        response_file = (file, first, last + 1 - first)
+                    except ValueError:
+                        file.close()
+                        status_code = 416
+                        content_range = f"bytes */{file_size}"
+                        response_body = '' if any(
+                            DEFAULT_USER_AGENT in header for header in headers) \
+                            else STATUS_MESSAGE[status_code]['htmlbody']
             # INVALID: PATH DOES NOT EXIST
             else:
                 status_code = 404
@@ -294,25 +514,42 @@ class HttpfsRequests:
             ) else STATUS_MESSAGE[status_code]['htmlbody']
 
         # set the content length
-        content_length = len(response_body)
+        content_length = response_file[2] if response_file \
+            else len(response_body.encode("utf-8"))
 
         # replace certain header queries if client specified them manually
         # in the header of request method
-        if status_code == 200:
+        # (not Content-Length: the client finds the end of the response with it)
+        if status_code in (200, 206):
             for header in headers:
-                if 'Content-Length' in header:
-                    content_length = header.replace(
-                        'Content-Length:', '').strip()
                 if 'Content-Type' in header:
                     content_type = header.replace('Content-Type:', '').strip()
 
         # create response message based on the info retrieved
+        # (only the header part if the body is to be streamed from response_file: (path, offset, count))
         response = self.create_response_message(
-            request_message_queries['protocol_ver'], status_code, connection, content_length, content_type, response_body)
-
-        return response
-
-    def create_response_message(self, protocol_ver, status_code, connection, content_length, content_type='', response_body=''):
+            request_message_queries['protocol_ver'], status_code, connection, content_length, content_type, response_body,
+            accept_ranges, content_range)
+
+        return response, response_file
+
+    def read_file(self, file, offset=0, count=None):
+        # yield the file content (count bytes from offset) chunk by chunk so that it never sits in memory as a whole
+        with file:
+            file.seek(offset)
+            while count is None or count > 0:
+                chunk = file.read(FILE_CHUNK_SIZE if count is None else min(FILE_CHUNK_SIZE, count))
+                if not chunk:
+                    if count is not None:
+                        # truncated since it was opened: the body can not be as long as announced
+                        raise OSError(f"{file.name} was truncated while it was sent")
+                    break
+                if count is not None:
+                    count -= len(chunk)
+                yield chunk
+
+    def create_response_message(self, protocol_ver, status_code, connection, content_length, content_type='', response_body='',
+                                accept_ranges=False, content_range=''):
         response = ''
 
         # create response message
@@ -320,6 +557,8 @@ class HttpfsRequests:
         response += f"Date: {DATE}\r\n"
         response += f"Content-Type: {content_type}\r\n" if content_type else ''
         response += f"Content-Length: {content_length}\r\n"
+        response += "Accept-Ranges: bytes\r\n" if accept_ranges else ''
+        response += f"Content-Range: {content_range}\r\n" if content_range else ''
         response += f"Connection: {connection}"
         response += f"\r\n\r\n{response_body}"
 
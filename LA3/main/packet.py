@@ -1,70 +1,85 @@
 import ipaddress
+import struct
 
 MIN_LEN = 11
 MAX_LEN = 1024
 
+# header in big-endian order: packet type (1 byte), sequence number (4 bytes),
+# peer ip address (4 bytes) and peer port (2 bytes)
+HEADER = struct.Struct('>BI4sH')
+
 
 class Packet:
     """
     Packet represents a simulated UDP packet.
     """
 
+    __slots__ = ('packet_type', 'seq_num', 'peer_ip', 'peer_port', 'payload')
+
     def __init__(self, packet_type, seq_num, peer_ip_addr, peer_port, payload):
-        self.packet_type = int(packet_type)
-        self.seq_num = int(seq_num)
-        self.peer_ip_addr = peer_ip_addr
-        self.peer_port = int(peer_port)
+        self.packet_type = packet_type
+        self.seq_num = seq_num
+        # peer ip address is kept packed (4 bytes), the way it goes on the wire
+        self.peer_ip = peer_ip_addr if isinstance(peer_ip_addr, bytes) else peer_ip_addr.packed
+        self.peer_port = peer_port
         self.payload = payload
 
+    @property
+    def peer_ip_addr(self):
+        return ipaddress.ip_address(self.peer_ip)
+
     def to_bytes(self):
         """
-        to_raw returns a bytearray representation of the packet in big-endian order.
+        to_bytes returns a bytes representation of the packet in big-endian order.
         """
-        buf = bytearray()
-        buf.extend(self.packet_type.to_bytes(1, byteorder='big'))
-        buf.extend(self.seq_num.to_bytes(4, byteorder='big'))
-        buf.extend(self.peer_ip_addr.packed)
-        buf.extend(self.peer_port.to_bytes(2, byteorder='big'))
+        return HEADER.pack(self.packet_type, self.seq_num, self.peer_ip, self.peer_port) + self.payload
+
+    def pack_into(self, buffer, offset=0):
+        """pack_into writes the packet in big-endian order straight into a (reusable) buffer.
+
+            Args:
+                buffer: a writable buffer (bytearray or memoryview) with room for the packet.
+                offset: position in the buffer where the packet starts.
 
-        buf.extend(self.payload)
+            Returns:
+                the number of bytes written.
+        """
+        self.pack_header_into(buffer, offset)
+        end = offset + MIN_LEN + len(self.payload)
+        buffer[offset + MIN_LEN:end] = self.payload
+        return end - offset
 
-        return buf
+    def pack_header_into(self, buffer, offset=0):
+        """
+        pack_header_into writes only the MIN_LEN bytes of header into a buffer (for scatter/gather I/O).
+        """
+        HEADER.pack_into(buffer, offset, self.packet_type, self.seq_num, self.peer_ip, self.peer_port)
 
     def __repr__(self, *args, **kwargs):
         return "#%d, peer=%s:%s, size=%d" % (self.seq_num, self.peer_ip_addr, self.peer_port, len(self.payload))
 
     @staticmethod
     def from_bytes(raw):
-        """from_bytes creates a packet from the given raw buffer.
+        """from_bytes creates a packet from the given raw buffer without copying its payload.
 
             Args:
-                raw: a bytearray that is the raw-representation of the packet in big-endian order.
+                raw: a bytes-like object that is the raw-representation of the packet in big-endian order.
 
             Returns:
-                a packet from the given raw bytes.
+                a packet from the given raw bytes, its payload is a memoryview into raw.
 
             Raises:
-                ValueError: if packet is too short or too long or invalid peer address.
+                ValueError: if packet is too short or too long.
         """
         if len(raw) < MIN_LEN:
             raise ValueError("packet is too short: {} bytes".format(len(raw)))
         if len(raw) > MAX_LEN:
             raise ValueError("packet is exceeded max length: {} bytes".format(len(raw)))
 
-        curr = [0, 0]
-
-        def nbytes(n):
-            curr[0], curr[1] = curr[1], curr[1] + n
-            return raw[curr[0]: curr[1]]
-
-        packet_type = int.from_bytes(nbytes(1), byteorder='big')
-        seq_num = int.from_bytes(nbytes(4), byteorder='big')
-        peer_addr = ipaddress.ip_address(nbytes(4))
-        peer_port = int.from_bytes(nbytes(2), byteorder='big')
-        payload = raw[curr[1]:]
+        packet_type, seq_num, peer_ip, peer_port = HEADER.unpack_from(raw)
 
         return Packet(packet_type=packet_type,
                       seq_num=seq_num,
-                      peer_ip_addr=peer_addr,
+                      peer_ip_addr=peer_ip,
                       peer_port=peer_port,
-                      payload=payload)
\ No newline at end of file
+                      payload=memoryview(raw)[MIN_LEN:])
@@ -0,0 +1,592 @@
+import random
+import struct
+from collections import OrderedDict, deque
+from congestion import create_controller
+from packet import Packet
+from utils.global_config import (
+    ACK_DELAY,
+    DEFAULT_CONGESTION_CONTROL,
+    DUP_ACK_THRESHOLD,
+    INITIAL_RTO,
+    MIN_RTO,
+    MAX_RTO,
+    MAX_PAYLOAD_SIZE,
+    MAX_SEQ_NUM,
+    DEFAULT_WINDOW_SIZE,
+    MAX_WINDOW_SIZE,
+    ConnectionState,
+    PacketType
+)
+
+
+class RttEstimator:
+    """
+    RttEstimator computes the retransmission timeout from RTT samples (Jacobson/Karels).
+
+    Callers must follow Karn's rule and only feed samples of packets
+    that were transmitted once; the RTO is doubled on every timeout.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            # first measurement
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.rto = min(max(self.srtt + self.K * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.max_rto)
+
+
+class Frame:
+    """
+    Frame is a packet in flight along with its retransmission timer.
+    """
+
+    def __init__(self, packet, sent_index):
+        self.packet = packet
+        # how many packets entered the window before this one
+        self.sent_index = sent_index
+        self.sent_at = None
+        self.deadline = None
+        self.transmissions = 0
+        self.acked = False
+        # packets sent after this one and ACKed before it
+        self.later_acks = 0
+        self.marked_lost = False
+
+
+class SelectiveRepeatSender:
+    """
+    SelectiveRepeatSender keeps up to a full window of packets in flight.
+
+    Messages queued with send() are split into DATA packets lazily, and numbered
+    as they enter the window, so that several messages (and the control packets
+    in between) follow each other on the same sequence space.
+    An ACK covers every packet before its cumulative sequence number, plus the ones
+    after it set in its SACK bitmap (received out of order), and ACKs may arrive in any order;
+    the window slides as soon as its base packet is acknowledged.
+    Every packet in flight has its own timer and the expired ones are resent.
+    A packet is considered lost once enough later packets got ACKed before it
+    (DUP_ACK_THRESHOLD at first, more when the path turns out to reorder packets),
+    and such a hole is resent right away without waiting for its timer.
+    The packets in flight are limited by the window of the receiver and by the
+    congestion window of the congestion controller, whichever is smaller.
+    It does no I/O by itself, the caller sends whatever it hands out.
+    """
+
+    def __init__(self, peer_ip_addr, peer_port, seq_start=0,
+                 window_size=DEFAULT_WINDOW_SIZE, payload_size=MAX_PAYLOAD_SIZE, rtt_estimator=None,
+                 congestion_controller=None):
+        self.peer_ip_addr = peer_ip_addr
+        self.peer_port = peer_port
+        # sequence number of the next packet entering the window
+        self.next_seq_num = seq_start
+        self.window_size = window_size
+        self.payload_size = payload_size
+        self.rtt = rtt_estimator if rtt_estimator else RttEstimator()
+        self.congestion = congestion_controller if congestion_controller else create_controller()
+        # queued messages, each one an iterator of (packet type, payload) pulled lazily
+        # so that a generator can stream them instead of building them all upfront
+        self.messages = deque()
+        self.next_payload = None
+        # frames in flight (seq num -> frame), in sending order: first one is the window base
+        self.window = OrderedDict()
+        self.in_flight = 0
+        self.sent_count = 0
+        # frames considered lost since the last call to expired()
+        self.lost = []
+        # losses of packets sent before this index belong to the same congestion event
+        self.recovery_point = 0
+        # later ACKs needed to consider a packet lost, and the frame that caused the last decrease
+        self.reordering = DUP_ACK_THRESHOLD
+        self.loss_frame = None
+
+    def send(self, chunks):
+        """send queues a message (a stream of byte chunks) behind the ones not sent yet."""
+        self.messages.append(segment(chunks, self.payload_size))
+
+    def send_control(self, packet_type, payload=b''):
+        """send_control queues a packet of its own (SYN, SYNACK or FIN), which also takes a sequence number."""
+        self.messages.append(iter([(packet_type, payload)]))
+
+    def has_pending(self):
+        # look ahead one packet, skipping over the messages already fully sent
+        while self.next_payload is None and self.messages:
+            self.next_payload = next(self.messages[0], None)
+            if self.next_payload is None:
+                self.messages.popleft()
+        return self.next_payload is not None
+
+    def done(self):
+        return not self.window and not self.has_pending()
+
+    def fill_window(self, now):
+        """fill_window moves pending packets into free frames of the window and starts their timers.
+
+            Returns:
+                the packets that just entered the window and have to be sent.
+        """
+        new_packets = []
+        while len(self.window) < self.window_size and \
+                self.in_flight < self.congestion.window() and self.has_pending():
+            packet_type, payload = self.next_payload
+            self.next_payload = None
+            frame = Frame(Packet(packet_type=packet_type,
+                                 seq_num=self.next_seq_num,
+                                 peer_ip_addr=self.peer_ip_addr,
+                                 peer_port=self.peer_port,
+                                 payload=payload), self.sent_count)
+            self.next_seq_num = (self.next_seq_num + 1) % MAX_SEQ_NUM
+            self.sent_count += 1
+            self.in_flight += 1
+            self.window[frame.packet.seq_num] = frame
+            self.start_timer(frame, now)
+            new_packets.append(frame.packet)
+        return new_packets
+
+    def start_timer(self, frame, now):
+        frame.sent_at = now
+        frame.deadline = now + self.rtt.rto
+        frame.transmissions += 1
+
+    def unacked(self):
+        """unacked returns the packets in flight that are still waiting for their ACK."""
+        return [frame.packet for frame in self.window.values() if not frame.acked]
+
+    def expired(self, now):
+        """expired restarts the timer of every unACKed packet whose timer has run out,
+        and of every packet found lost since the last call (fast retransmit),
+        and tells the congestion controller about timeouts and losses.
+
+            Returns:
+                the packets that have to be retransmitted.
+        """
+        expired_frames = [frame for frame in self.window.values()
+                          if not frame.acked and frame.deadline <= now]
+        lost_frames = [frame for frame in self.lost
+                       if not frame.acked and frame.deadline > now]
+        self.lost.clear()
+
+        if expired_frames:
+            self.rtt.backoff()
+            self.congestion.on_timeout(now)
+            self.recovery_point = self.sent_count
+            self.loss_frame = None
+        else:
+            # one decrease per window of data, however many packets of it were lost
+            new_losses = [frame for frame in lost_frames if frame.sent_index >= self.recovery_point]
+            if new_losses:
+                self.congestion.on_loss(now)
+                self.recovery_point = self.sent_count
+                self.loss_frame = new_losses[0]
+
+        for frame in expired_frames + lost_frames:
+            self.start_timer(frame, now)
+        return [frame.packet for frame in expired_frames + lost_frames]
+
+    def time_to_next_timeout(self, now):
+        """time_to_next_timeout returns how long the caller may wait for an ACK (None if nothing is in flight)."""
+        deadlines = [frame.deadline for frame in self.window.values() if not frame.acked]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - now, 0)
+
+    def acked_frames(self, cumulative_ack, sack=b''):
+        """acked_frames returns the frames of the window an ACK newly covers, in sending order."""
+        frames = list(self.window.values())
+        if not frames:
+            return []
+        # the window holds consecutive sequence numbers from its base
+        base = frames[0].packet.seq_num
+        covered = (cumulative_ack - base) % MAX_SEQ_NUM
+        indexes = set(range(covered)) if covered <= len(frames) else set()
+        for seq_num in sacked_seq_nums(cumulative_ack, sack):
+            indexes.add((seq_num - base) % MAX_SEQ_NUM)
+        return [frame for index, frame in enumerate(frames) if index in indexes and not frame.acked]
+
+    def acknowledge(self, cumulative_ack, now, sack=b''):
+        """acknowledge marks the packets an ACK covers as ACKed and slides the window if its base got ACKed.
+
+            Args:
+                cumulative_ack: every packet before this sequence number was received.
+                sack: SACK bitmap of the packets received after it (see sack_bitmap).
+
+            Returns:
+                the number of packets newly ACKed (0 for a duplicate or an ACK outside the window).
+        """
+        acked_frames = self.acked_frames(cumulative_ack, sack)
+        for frame in acked_frames:
+            frame.acked = True
+            self.in_flight -= 1
+            # Karn's rule: the ACK of a retransmitted packet is ambiguous, do not sample it
+            rtt = now - frame.sent_at if frame.transmissions == 1 else None
+            if rtt is not None:
+                self.rtt.sample(rtt)
+            self.congestion.on_ack(now, rtt, self.window_size)
+
+            if frame.marked_lost and self.is_spurious(frame, now):
+                # the packet was not lost but reordered: ask for more later ACKs from now on,
+                # and give back the window its false loss cost
+                self.reordering = min(max(self.reordering, frame.later_acks + 1), self.window_size)
+                if frame is self.loss_frame:
+                    self.congestion.undo(now)
+                    self.loss_frame = None
+
+        # an unACKed packet sent before enough ACKed ones was most likely lost
+        if acked_frames:
+            newly_acked = set(acked_frames)
+            later_acks = 0
+            for frame in reversed(self.window.values()):
+                if frame.acked:
+                    later_acks += frame in newly_acked
+                    continue
+                frame.later_acks += later_acks
+                if frame.later_acks >= self.reordering and not frame.marked_lost:
+                    frame.marked_lost = True
+                    self.lost.append(frame)
+
+        # slide the window over every acknowledged frame sitting at its base
+        while self.window and next(iter(self.window.values())).acked:
+            self.window.popitem(last=False)
+        return len(acked_frames)
+
+    def is_spurious(self, frame, now):
+        # ACKed before its retransmission could have made it there and back:
+        # the first transmission was only late
+        if frame.transmissions == 1:
+            return True
+        return self.rtt.srtt is not None and now - frame.sent_at < self.rtt.srtt / 2
+
+
+class SelectiveRepeatReceiver:
+    """
+    SelectiveRepeatReceiver accepts DATA and FIN packets within its window in any order.
+
+    Out-of-order packets are kept in a reassembly buffer until the gap
+    before them is filled, then handed out in sequence order.
+    """
+
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE, seq_space=MAX_SEQ_NUM, seq_start=0):
+        self.window_size = window_size
+        self.seq_space = seq_space
+        # sequence number of the first frame in window (next one to be delivered)
+        self.seq_start = seq_start
+        # packets received ahead of the window base (seq num -> packet)
+        self.received_buffer = {}
+
+    def offset(self, seq_num):
+        return (seq_num - self.seq_start) % self.seq_space
+
+    def in_window(self, seq_num):
+        return self.offset(seq_num) < self.window_size
+
+    def should_acknowledge(self, seq_num):
+        """should_acknowledge tells if the packet is in the window or in the previous one
+        (already delivered, but its ACK may have been lost)."""
+        return self.in_window(seq_num) or self.offset(seq_num) >= self.seq_space - self.window_size
+
+    def receive(self, packet):
+        """receive buffers a DATA or FIN packet.
+
+            Returns:
+                True if the packet is new, False if it is a duplicate or outside the window.
+        """
+        seq_num = packet.seq_num
+        if not self.in_window(seq_num) or seq_num in self.received_buffer:
+            return False
+        if seq_num != self.seq_start:
+            # an out-of-order packet outlives the receive buffer its payload points into
+            packet.payload = bytes(packet.payload)
+        self.received_buffer[seq_num] = packet
+        return True
+
+    def sack(self):
+        """sack returns the SACK bitmap of the packets buffered ahead of the window base."""
+        return sack_bitmap(self.seq_start, self.received_buffer)
+
+    def deliver(self):
+        """deliver slides the window over the in-order part of the reassembly buffer.
+
+            Returns:
+                the packets that became in order, in sequence order.
+        """
+        packets = []
+        while self.seq_start in self.received_buffer:
+            packets.append(self.received_buffer.pop(self.seq_start))
+            self.seq_start = (self.seq_start + 1) % self.seq_space
+        return packets
+
+
+def sack_bitmap(cumulative_ack, seq_nums):
+    """sack_bitmap encodes the packets received after cumulative_ack (which is missing).
+
+        Bit i (most significant bit first) is set if packet cumulative_ack + 1 + i was received.
+        The bitmap stops at its last set bit, and at what fits in a packet.
+    """
+    bitmap = bytearray()
+    for seq_num in seq_nums:
+        bit = (seq_num - cumulative_ack - 1) % MAX_SEQ_NUM
+        if bit >= MAX_PAYLOAD_SIZE * 8:
+            continue
+        if bit >> 3 >= len(bitmap):
+            bitmap.extend(bytes((bit >> 3) + 1 - len(bitmap)))
+        bitmap[bit >> 3] |= 0x80 >> (bit & 7)
+    return bytes(bitmap)
+
+
+def sacked_seq_nums(cumulative_ack, bitmap):
+    """sacked_seq_nums decodes a SACK bitmap into the sequence numbers it acknowledges."""
+    for index, byte in enumerate(bitmap):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (0x80 >> bit):
+                yield (cumulative_ack + 1 + index * 8 + bit) % MAX_SEQ_NUM
+
+
+def check_sizes(window_size, payload_size):
+    """check_sizes validates the window size and max payload size an end proposes or accepts.
+
+        Raises:
+            ValueError: if one of them is out of range.
+    """
+    if not 1 <= window_size <= MAX_WINDOW_SIZE:
+        raise ValueError("window size must be between 1 and {} packets".format(MAX_WINDOW_SIZE))
+    if not 1 <= payload_size <= MAX_PAYLOAD_SIZE:
+        raise ValueError("payload size must be between 1 and {} bytes".format(MAX_PAYLOAD_SIZE))
+
+
+# handshake parameters: the SYN proposes a window size (in packets) and a max payload size (in bytes),
+# the SYNACK acknowledges the client's ISN and carries the sizes both ends agreed on
+SYN_PARAMS = struct.Struct('>HH')
+SYNACK_PARAMS = struct.Struct('>IHH')
+
+
+class ReliableConnection:
+    """
+    ReliableConnection is one end of a connection: three-way handshake,
+    a reliable byte stream in each direction, and FIN teardown.
+
+    The client connect()s with a SYN (its ISN, proposed window and payload sizes),
+    the server accept()s it with a SYNACK (its own ISN, ACK of the client's ISN,
+    the smallest sizes of both ends), and the client ACKs the SYNACK.
+    Data in each direction starts right after its ISN, and any number of messages
+    can follow each other until close() queues a FIN behind them.
+    Every ACK is cumulative and carries the SACK bitmap of what was received out of order;
+    with delayed_ack, an in-order DATA packet is acknowledged along with the next one
+    (or after ACK_DELAY), which halves the ACKs of a bulk transfer.
+    Like the sender and receiver it is made of, it does no I/O by itself.
+    """
+
+    def __init__(self, peer_ip_addr, peer_port, window_size=DEFAULT_WINDOW_SIZE, payload_size=MAX_PAYLOAD_SIZE,
+                 congestion_control=DEFAULT_CONGESTION_CONTROL, delayed_ack=False, cwnd_trace=False):
+        check_sizes(window_size, payload_size)
+        self.peer_ip_addr = peer_ip_addr
+        self.peer_port = peer_port
+        self.window_size = window_size
+        self.payload_size = payload_size
+        # name of the congestion controller of the sender (see congestion.CONGESTION_CONTROLLERS)
+        self.congestion_control = congestion_control
+        # keep the cwnd trace of the sender (only if it is to be exported)
+        self.cwnd_trace = cwnd_trace
+        self.state = ConnectionState.CLOSED
+        # initial sequence numbers of both directions
+        self.isn = None
+        self.peer_isn = None
+        self.sender = None
+        self.receiver = None
+        # in-order bytes received from the peer, consumed by the application
+        self.received_data = bytearray()
+        # messages (None for the FIN) given before the payload size is negotiated
+        self.queued = []
+        self.fin_sent = False
+        # the peer's FIN was received in order: it will not send anything more
+        self.peer_closed = False
+        # time the delayed ACK of an in-order packet is due at (None if there is none)
+        self.delayed_ack = delayed_ack
+        self.ack_deadline = None
+
+    def connect(self):
+        """connect starts the handshake by queuing a SYN with the proposed sizes."""
+        self.open_sender()
+        self.sender.send_control(PacketType.SYN, SYN_PARAMS.pack(self.window_size, self.payload_size))
+        self.state = ConnectionState.SYN_SENT
+
+    def accept(self, syn_packet):
+        """accept answers the SYN of a client by queuing a SYNACK with the negotiated sizes.
+
+            Raises:
+                ValueError: if the SYN does not carry the handshake parameters.
+        """
+        if len(syn_packet.payload) < SYN_PARAMS.size:
+            raise ValueError("SYN is too short: {} bytes".format(len(syn_packet.payload)))
+        self.negotiate(*SYN_PARAMS.unpack_from(syn_packet.payload))
+        self.open_sender()
+        self.open_receiver(syn_packet.seq_num)
+        self.sender.send_control(PacketType.SYNACK, SYNACK_PARAMS.pack(
+            self.peer_isn, self.window_size, self.payload_size
+        ))
+        self.state = ConnectionState.SYN_RECEIVED
+
+    def negotiate(self, window_size, payload_size):
+        # both ends use the smallest window and payload sizes
+        self.window_size = max(min(self.window_size, window_size), 1)
+        self.payload_size = max(min(self.payload_size, payload_size), 1)
+
+    def open_sender(self):
+        self.isn = random.randrange(MAX_SEQ_NUM)
+        self.sender = SelectiveRepeatSender(self.peer_ip_addr, self.peer_port, self.isn,
+                                            self.window_size, self.payload_size,
+                                            congestion_controller=create_controller(self.congestion_control, self.cwnd_trace))
+
+    def open_receiver(self, peer_isn):
+        self.peer_isn = peer_isn
+        self.receiver = SelectiveRepeatReceiver(self.window_size, seq_start=(peer_isn + 1) % MAX_SEQ_NUM)
+
+    def establish(self):
+        self.state = ConnectionState.ESTABLISHED
+        # what was given during the handshake can now be split with the negotiated payload size
+        for chunks in self.queued:
+            if chunks is None:
+                self.sender.send_control(PacketType.FIN)
+            else:
+                self.sender.send(chunks)
+        self.queued.clear()
+
+    def send(self, chunks):
+        """send queues a message (a stream of byte chunks) behind the ones not sent yet."""
+        if self.state == ConnectionState.ESTABLISHED:
+            self.sender.send(chunks)
+        else:
+            self.queued.append(chunks)
+
+    def close(self):
+        """close queues a FIN behind the messages not sent yet, nothing can be sent afterwards."""
+        if self.fin_sent:
+            return
+        self.fin_sent = True
+        if self.state == ConnectionState.ESTABLISHED:
+            self.sender.send_control(PacketType.FIN)
+        else:
+            self.queued.append(None)
+
+    def is_closed(self):
+        """is_closed tells if both FINs were exchanged and everything sent was acknowledged."""
+        return self.fin_sent and self.peer_closed and not self.queued and self.sender.done()
+
+    def packet_received(self, packet, now):
+        """packet_received updates the connection with a packet of the peer.
+
+            New in-order DATA is appended to received_data.
+
+            Returns:
+                the ACK packet to send back, or None.
+        """
+        packet_type = packet.packet_type
+        seq_num = packet.seq_num
+
+        # ACK of packets we sent (the one of the SYNACK completes the server's handshake)
+        if packet_type == PacketType.ACK:
+            if self.sender.acknowledge(seq_num, now, packet.payload) and \
+                    self.state == ConnectionState.SYN_RECEIVED:
+                self.establish()
+            return None
+
+        if packet_type == PacketType.SYNACK:
+            if self.state == ConnectionState.SYN_SENT and len(packet.payload) >= SYNACK_PARAMS.size:
+                acked_isn, window_size, payload_size = SYNACK_PARAMS.unpack_from(packet.payload)
+                if acked_isn != self.isn:
+                    return None
+                self.sender.acknowledge((self.isn + 1) % MAX_SEQ_NUM, now)
+                self.negotiate(window_size, payload_size)
+                self.sender.window_size = self.window_size
+                self.sender.payload_size = self.payload_size
+                self.open_receiver(seq_num)
+                self.establish()
+            # ACK the SYNACK every time, the server resends it until it gets the ACK
+            return self.acknowledgement() if self.receiver else None
+
+        if packet_type not in (PacketType.DATA, PacketType.FIN) or self.receiver is None:
+            # e.g. a duplicate SYN: the SYNACK timer resends the answer by itself
+            return None
+
+        if self.state == ConnectionState.SYN_RECEIVED:
+            # the client only sends data after the SYNACK: the ACK of the SYNACK was lost
+            self.sender.acknowledge((self.isn + 1) % MAX_SEQ_NUM, now)
+            self.establish()
+
+        if self.receiver.receive(packet):
+            delivered = self.receiver.deliver()
+            for in_order_packet in delivered:
+                if in_order_packet.packet_type == PacketType.FIN:
+                    self.peer_closed = True
+                else:
+                    self.received_data.extend(in_order_packet.payload)
+            # only a lone in-order DATA packet may wait for the next one,
+            # anything out of order (or filling a hole) and the FIN are ACKed right away
+            in_order = len(delivered) == 1 and delivered[0] is packet and not self.receiver.received_buffer
+            if self.delayed_ack and in_order and packet_type == PacketType.DATA and self.ack_deadline is None:
+                self.ack_deadline = now + ACK_DELAY
+                return None
+            return self.acknowledgement()
+
+        if self.receiver.should_acknowledge(seq_num):
+            # already received, but the peer did not get the ACK
+            return self.acknowledgement()
+        return None
+
+    def acknowledgement(self):
+        """acknowledgement returns the ACK of everything received so far (which covers a delayed one)."""
+        self.ack_deadline = None
+        return self.create_ack(self.receiver.seq_start, self.receiver.sack())
+
+    def ack_due(self, now):
+        """ack_due returns the delayed ACK if it has waited long enough, None otherwise."""
+        if self.ack_deadline is None or self.ack_deadline > now:
+            return None
+        return self.acknowledgement()
+
+    def time_to_ack(self, now):
+        """time_to_ack returns how long the delayed ACK may still wait (None if there is none)."""
+        if self.ack_deadline is None:
+            return None
+        return max(self.ack_deadline - now, 0)
+
+    def create_ack(self, seq_num, sack=b''):
+        # cumulative ACK: every packet before seq_num was received,
+        # and the ones after it set in the SACK bitmap (payload) too
+        return Packet(packet_type=PacketType.ACK,
+                      seq_num=seq_num,
+                      peer_ip_addr=self.peer_ip_addr,
+                      peer_port=self.peer_port,
+                      payload=sack)
+
+
+def segment(chunks, payload_size=MAX_PAYLOAD_SIZE):
+    """segment splits a stream of byte chunks into DATA payloads.
+
+        Payloads of at most payload_size are yielded as soon as enough bytes are available.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= payload_size:
+            yield PacketType.DATA, bytes(buffer[:payload_size])
+            del buffer[:payload_size]
+    if buffer:
+        yield PacketType.DATA, bytes(buffer)
@@ -0,0 +1,41 @@
+import unittest
+from utils.http_message import message_bounds, next_message
+
+
+class MessageBoundsTest(unittest.TestCase):
+    """Framing of the HTTP messages received on a connection (RFC 7230, section 3.3.3)."""
+
+    def test_content_length(self):
+        data = b'POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\nhelloGET'
+        self.assertEqual(message_bounds(data), (0, len(data) - 3))
+        self.assertIsNone(message_bounds(b'POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\nhel'))
+
+    def test_request_without_length_has_no_body(self):
+        for method in (b'GET', b'POST', b'PUT', b'DELETE'):
+            data = method + b' /a HTTP/1.1\r\nHost: x\r\n\r\n'
+            self.assertEqual(message_bounds(data + b'GET /b HTTP/1.1\r\n'), (0, len(data)))
+
+    def test_request_with_transfer_encoding_lasts_until_close(self):
+        data = b'POST /a HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n'
+        self.assertIsNone(message_bounds(data))
+        self.assertEqual(message_bounds(data, closed=True), (0, len(data)))
+
+    def test_response_without_length_lasts_until_close(self):
+        data = b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nhello'
+        self.assertIsNone(message_bounds(data))
+        self.assertEqual(message_bounds(data, closed=True), (0, len(data)))
+
+    def test_body_cut_short_by_close(self):
+        data = b'POST /a HTTP/1.1\r\nContent-Length: 10\r\n\r\nhello'
+        self.assertEqual(message_bounds(data, closed=True), (0, len(data)))
+
+    def test_empty_lines_skipped(self):
+        data = bytearray(b'\r\nGET /a HTTP/1.1\r\n\r\n\r\nGET /b HTTP/1.1\r\n\r\n')
+        self.assertEqual(next_message(data), b'GET /a HTTP/1.1\r\n\r\n')
+        self.assertEqual(next_message(data), b'GET /b HTTP/1.1\r\n\r\n')
+        self.assertIsNone(next_message(data))
+        self.assertIsNone(next_message(data, closed=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -41,6 +41,12 @@ class HttpcManuals:
     RP_HELP = "Set default router port"
     SH_HELP = "Set default server host"
     SP_HELP = "Set default server port"
+    CC_HELP = "Congestion control of the sender: reno (loss-based AIMD, default) " + \
+        "or delay (delay-based, Vegas-like)"
+    CWND_TRACE_HELP = "Records the congestion window of the connection in the specified csv file"
+    W_HELP = "Window size (in packets) proposed to the server, the smallest of both is used"
+    PS_HELP = "Max payload size of a packet (in bytes) proposed to the server, the smallest of both is used"
+    DA_HELP = "Delays ACKs: every other in-order packet of the response is acknowledged with the next one"
 
     GET_HELP_CUSTOM = f"\
     \nUsage: httpc get [-v] [-h key:value] URL [-o output-file] FILENAME \
@@ -54,6 +60,11 @@ class HttpcManuals:
     \n  -rp             {RP_HELP} \
     \n  -sh             {SH_HELP} \
     \n  -sv             {SP_HELP} \
+    \n  -cc             {CC_HELP} \
+    \n  --cwnd-trace    {CWND_TRACE_HELP} \
+    \n  -w              {W_HELP} \
+    \n  -ps             {PS_HELP} \
+    \n  --delayed-ack   {DA_HELP} \
     "
 
     POST_HELP_CUSTOM = f"\
@@ -72,6 +83,11 @@ class HttpcManuals:
     \n  -rp             {RP_HELP} \
     \n  -sh             {SH_HELP} \
     \n  -sv             {SP_HELP} \
+    \n  -cc             {CC_HELP} \
+    \n  --cwnd-trace    {CWND_TRACE_HELP} \
+    \n  -w              {W_HELP} \
+    \n  -ps             {PS_HELP} \
+    \n  --delayed-ack   {DA_HELP} \
     "
 
 
@@ -81,12 +97,23 @@ class HttpfsManuals:
     P_HELP = "Specifies the port number that the server will listen and serve at. \
     \n      Default is 8080."
     D_HELP = "Associates an inline data to the body HTTP POST request."
+    CC_HELP = "Congestion control of the responses: reno (loss-based AIMD, default) " + \
+        "or delay (delay-based, Vegas-like)"
+    CWND_TRACE_HELP = "Records the congestion window of every connection in a csv file per client."
+    W_HELP = "Largest window size (in packets) accepted from clients."
+    PS_HELP = "Largest max payload size of a packet (in bytes) accepted from clients."
+    DA_HELP = "Delays ACKs: every other in-order packet of a request is acknowledged with the next one."
 
     HELP = f"httpfc is a simple file server. \
-    \nUsage: httpfc [-v] [-p PORT] [-d PATH-TO-DIR] \
+    \nUsage: httpfc [-v] [-p PORT] [-d PATH-TO-DIR] [-cc reno|delay] [--cwnd-trace] [-w N] [-ps N] [--delayed-ack] \
     \n  -v\t{V_HELP} \
     \n  -p\t{P_HELP} \
     \n  -d\t{D_HELP} \
+    \n  -cc\t{CC_HELP} \
+    \n  --cwnd-trace\t{CWND_TRACE_HELP} \
+    \n  -w\t{W_HELP} \
+    \n  -ps\t{PS_HELP} \
+    \n  --delayed-ack\t{DA_HELP} \
     "
 
 
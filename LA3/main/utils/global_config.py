@@ -23,6 +23,32 @@ DEFAULT_SERVER_PORT = 8007
 # connection timeout
 CONN_TIMEOUT = 2
 
+# retransmission timeout (in seconds) used before the first RTT sample is taken,
+# and the bounds the adaptive RTO (smoothed RTT + 4 * RTT variance) is kept within
+INITIAL_RTO = 1
+MIN_RTO = 0.01
+MAX_RTO = 10
+
+# congestion control: window a connection starts with and initial slow start threshold (in packets),
+# and how many later packets must be ACKed before an unACKed one is considered lost (fast retransmit)
+DEFAULT_CONGESTION_CONTROL = 'reno'
+INITIAL_CWND = 2
+INITIAL_SSTHRESH = 64
+DUP_ACK_THRESHOLD = 3
+
+# delayed ACKs (when enabled): an in-order packet may wait this long (in seconds) for the next one
+# to be acknowledged along with it, well below MIN_RTO so that the peer never times out on it
+ACK_DELAY = 0.002
+
+# a server connection (client flow) is dropped after this many idle seconds
+CONN_IDLE_TIMEOUT = 30
+
+# files served are read (and streamed into packets) by chunks of this size
+FILE_CHUNK_SIZE = 8192
+
+# max number of datagrams drained from a socket per wakeup (size of the receive buffer pool)
+MAX_BATCH_SIZE = 64
+
 # headers: default user agent (for console output)
 # html body response depends on the user agent
 DEFAULT_USER_AGENT = 'Concordia-HTTP/1.0'
@@ -35,6 +61,10 @@ STATUS_MESSAGE = {
     {
         'message': 'OK'
     },
+    206:
+    {
+        'message': 'Partial Content'
+    },
     400:
     {
         'message': 'Bad Request',
@@ -52,6 +82,12 @@ STATUS_MESSAGE = {
         'message': 'File Not Found',
         'htmlbody': '<html><body><center style="padding: 20px">' +
         '<h1>Error 404: File Not Found</h1></center></body></html>',
+    },
+    416:
+    {
+        'message': 'Range Not Satisfiable',
+        'htmlbody': '<html><body><center style="padding: 20px">' +
+        '<h1>Error 416: Range Not Satisfiable</h1></center></body></html>',
     }
 }
 
@@ -68,7 +104,7 @@ class PacketType(IntEnum):
     [2] SYNACK: SYN message from local device and ACK of the earlier packet
     [3] ACK: helps to confirm to the other side that it has received the SYN
     [4] NACK:
-    [5] FIN:
+    [5] FIN: no more data will be sent, closes the sender's direction of the connection
     '''
     DATA, SYN, SYNACK, ACK, NACK, FIN = range(0, 6)
 
@@ -77,12 +113,27 @@ class PacketStatus(IntEnum):
     CREATED, SENT, RECEIVED = range(0, 3)
 
 
-MAX_SEQ_NUM = 9
+class ConnectionState(IntEnum):
+    '''
+    [0] CLOSED: no handshake started yet
+    [1] SYN_SENT: client sent its SYN, waiting for the SYNACK
+    [2] SYN_RECEIVED: server answered a SYN, waiting for the ACK of its SYNACK
+    [3] ESTABLISHED: handshake done, DATA may flow both ways until both FINs are exchanged
+    '''
+    CLOSED, SYN_SENT, SYN_RECEIVED, ESTABLISHED = range(0, 4)
+
+
+# sequence numbers use the whole 32-bit field of the packet header, and wrap around it
+MAX_SEQ_NUM = 2 ** 32
+# a packet is at most 1024 bytes, 11 of which are the header
 MAX_PAYLOAD_SIZE = 1013
-MAX_WINDOW_SIZE = 4
+# window size (in packets) proposed by the client and accepted by the server unless set otherwise,
+# and the largest one the handshake can negotiate (the window size field of the SYN is 16 bits)
+DEFAULT_WINDOW_SIZE = 64
+MAX_WINDOW_SIZE = 2 ** 15
 MAX_BUFFER_SIZE = 10
 
-# MAX_SEQ_NUM >= MAX_WINDOW_SIZE
+# MAX_SEQ_NUM >= 2 * MAX_WINDOW_SIZE
 # MAX_BUFFER_SIZZE >= MAX_WINDOW_SIZE
 
 # Sender’s Windows ( Ws) = Receiver’s Windows ( Wr)
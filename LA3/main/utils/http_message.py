@@ -0,0 +1,125 @@
+'''
+HTTP messages follow each other on a connection, so the end of a message
+is found from its header: the body is Content-Length bytes long.
+Without Content-Length, a response lasts until the peer closes the connection (FIN),
+and so does a request with a Transfer-Encoding (its body is not decoded):
+any other request has no body (RFC 7230, section 3.3.3).
+'''
+
+
+def message_bounds(data, closed=False):
+    """message_bounds finds the first complete HTTP message in the bytes received so far.
+
+        Empty lines in front of it (such as the CRLF sent after a POST body) are skipped.
+
+        Args:
+            data: the bytes received (bytes or bytearray).
+            closed: the peer sent its FIN, nothing will be added to data anymore:
+                whatever is left makes the last message.
+
+        Returns:
+            (start, end) of the message in data, or None if it is not complete yet
+            (or there is none left once closed).
+    """
+    start = 0
+    while data.startswith(b'\r\n', start):
+        start += 2
+    if start == len(data):
+        return None
+
+    header_end = data.find(b'\r\n\r\n', start)
+    if header_end == -1:
+        return (start, len(data)) if closed else None
+
+    content_length = None
+    transfer_encoding = False
+    header_lines = bytes(data[start:header_end]).split(b'\r\n')
+    for header in header_lines[1:]:
+        name, _, value = header.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            try:
+                content_length = max(int(value.strip()), 0)
+            except ValueError:
+                pass
+        elif name == b'transfer-encoding':
+            transfer_encoding = True
+
+    if content_length is None:
+        if header_lines[0].startswith(b'HTTP/') or transfer_encoding:
+            # the body is delimited by the end of the connection
+            return (start, len(data)) if closed else None
+        # a request which does not announce a body has none, whatever its method
+        content_length = 0
+
+    end = header_end + 4 + content_length
+    if len(data) >= end:
+        return (start, end)
+    # a body cut short by the FIN is all there will ever be
+    return (start, len(data)) if closed else None
+
+
+def next_message(data, closed=False):
+    """next_message takes the first complete HTTP message out of the bytes received so far.
+
+        Each message is returned exactly once, as it is removed from data along with
+        the empty lines in front of it.
+
+        Args:
+            data: the in-order bytes received on the connection (bytearray), consumed in place.
+            closed: the peer sent its FIN (see message_bounds).
+
+        Returns:
+            the whole message (bytes), or None if no message is complete yet.
+    """
+    bounds = message_bounds(data, closed)
+    if bounds is None:
+        return None
+    start, end = bounds
+    message = bytes(data[start:end])
+    del data[:end]
+    return message
+
+
+def parse_range(headers, size):
+    """parse_range finds the bytes requested by the Range header of a request, for a file of size bytes.
+
+        A single range is served (bytes=first-last, bytes=first- or bytes=-suffix-length):
+        several ranges, other units or a header which is not valid are ignored, the whole file is sent.
+
+        Args:
+            headers: the header lines of the request ('Name: value' str).
+            size: size of the file in bytes.
+
+        Returns:
+            (first, last) positions of the bytes (inclusive), or None for the whole file.
+
+        Raises:
+            ValueError: if the range is not satisfiable (none of its bytes are in the file).
+    """
+    value = None
+    for header in headers:
+        name, _, header_value = header.partition(':')
+        if name.strip().lower() == 'range':
+            value = header_value
+    if value is None:
+        return None
+
+    unit, _, byte_range = value.strip().partition('=')
+    first, dash, last = byte_range.strip().partition('-')
+    first, last = first.strip(), last.strip()
+    if unit.strip().lower() != 'bytes' or ',' in byte_range or not dash or \
+            not (first.isdigit() or first == '') or not (last.isdigit() or last == '') or first == last == '':
+        return None
+
+    if first == '':
+        # the last bytes of the file
+        if int(last) == 0 or size == 0:
+            raise ValueError("range not satisfiable: {}".format(value.strip()))
+        return max(size - int(last), 0), size - 1
+    first, last = int(first), int(last) if last else None
+    if last is not None and last < first:
+        return None
+    if first >= size:
+        raise ValueError("range not satisfiable: {}".format(value.strip()))
+    return first, size - 1 if last is None else min(last, size - 1)